@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_user_email_index(sender, using, **kwargs):
+    from .backends import create_email_index
+
+    create_email_index(using)
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounts"
+
+    def ready(self):
+        post_migrate.connect(create_user_email_index, sender=self)
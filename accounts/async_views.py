@@ -0,0 +1,149 @@
+"""
+Async versions of the login, registration and password reset endpoints.
+
+They are served instead of the DRF views when ASYNC_AUTH_VIEWS is enabled
+(the default under ``userhub.asgi``). Password hashing and verification run
+on the process pool in ``accounts.hashing`` so the event loop stays free,
+and requests are shed with 503 when that pool is saturated. Logins go
+through AUTHENTICATION_BACKENDS like the DRF view, see
+``accounts.backends.aauthenticate()``.
+"""
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .authentication import CachedJWTAuthentication
+from .backends import aauthenticate
+from .hashing import HashingPoolBusy, acheck_password, amake_password
+from .serializers import (
+    LoginCredentialsSerializer,
+    PasswordResetSerializer,
+    UserRegistrationSerializer,
+)
+
+
+class AsyncAPIView(View):
+    """
+    Base class for the async JSON endpoints.
+    """
+
+    http_method_names = ["post", "options"]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Token authenticated, like the DRF views they replace.
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            self.data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error"}, status=400)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except HashingPoolBusy:
+            return JsonResponse(
+                {"detail": "Server is busy, please retry shortly."},
+                status=503,
+                headers={"Retry-After": "1"},
+            )
+
+
+class LoginView(AsyncAPIView):
+    """
+    User Login Endpoint
+    """
+
+    async def post(self, request, *args, **kwargs):
+        serializer = LoginCredentialsSerializer(data=self.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        email = serializer.validated_data["email"]
+        password = serializer.validated_data["password"]
+
+        # Same errors as UserLoginSerializer.
+        user = await aauthenticate(request, email=email, password=password)
+        if user is None:
+            return JsonResponse(
+                {"non_field_errors": ["Invalid credentials"]}, status=400
+            )
+        if not user.is_active:
+            return JsonResponse(
+                {"non_field_errors": ["User account is disabled"]}, status=400
+            )
+
+        refresh = await sync_to_async(RefreshToken.for_user)(user)
+        return JsonResponse(
+            {
+                "refresh": str(refresh),
+                "access": str(refresh.access_token),
+                "user": {"id": user.id, "username": user.username, "email": user.email},
+            }
+        )
+
+
+class RegisterView(AsyncAPIView):
+    """
+    User Registration Endpoint
+    """
+
+    async def post(self, request, *args, **kwargs):
+        serializer = UserRegistrationSerializer(data=self.data)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=400)
+
+        encoded = await amake_password(serializer.validated_data["password"])
+        user = await sync_to_async(serializer.save)(encoded_password=encoded)
+
+        return JsonResponse(
+            {
+                "message": "User registered successfully",
+                "user": {"id": user.id, "username": user.username, "email": user.email},
+            },
+            status=201,
+        )
+
+
+class PasswordResetView(AsyncAPIView):
+    """
+    Password Reset Endpoint
+    """
+
+    async def post(self, request, *args, **kwargs):
+        authentication = CachedJWTAuthentication()
+        try:
+            result = await sync_to_async(authentication.authenticate)(request)
+        except (AuthenticationFailed, InvalidToken) as exc:
+            detail = (
+                exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+            )
+            return JsonResponse(detail, status=401)
+        if result is None:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=401,
+            )
+        user, _ = result
+        request.user = user
+
+        serializer = PasswordResetSerializer(
+            data=self.data, context={"request": request, "old_password_checked": True}
+        )
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        if not await acheck_password(
+            serializer.validated_data["old_password"], user.password
+        ):
+            return JsonResponse({"old_password": ["Invalid old password"]}, status=400)
+
+        user.password = await amake_password(serializer.validated_data["new_password"])
+        await sync_to_async(user.save)(update_fields=["password"])
+
+        return JsonResponse({"message": "Password updated successfully"})
@@ -0,0 +1,135 @@
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import _clean_credentials, load_backend
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_login_failed
+from django.core.exceptions import PermissionDenied
+from django.db import connections, models, router
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+from .hashing import (
+    acheck_password,
+    amake_password,
+    hashing_seconds,
+    password_needs_update,
+)
+
+# Functional index backing case-insensitive email lookups on auth_user.
+EMAIL_INDEX = models.Index(Lower("email"), name="accounts_user_email_lower_idx")
+
+
+def users_with_email(email, queryset=None):
+    """
+    Filters users by email, case-insensitively.
+
+    Compares ``LOWER(email)`` rather than using ``email__iexact`` so the
+    lookup can use EMAIL_INDEX instead of scanning auth_user.
+    """
+    if queryset is None:
+        queryset = User.objects.all()
+    return queryset.alias(email_lower=Lower("email")).filter(
+        email_lower=Lower(Value(email))
+    )
+
+
+def create_email_index(using="default"):
+    """
+    Adds EMAIL_INDEX to auth_user if it is missing.
+    """
+    if not router.allow_migrate_model(using, User):
+        # e.g. task shards, which hold no users.
+        return False
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, User._meta.db_table
+        )
+    if EMAIL_INDEX.name in constraints:
+        return False
+    with connection.schema_editor() as schema_editor:
+        schema_editor.add_index(User, EMAIL_INDEX)
+    return True
+
+
+class EmailBackend(ModelBackend):
+    """
+    Authenticates against the user's email address with a single query.
+    """
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if email is None or password is None:
+            return None
+
+        user = users_with_email(email).order_by("pk").first()
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            with hashing_seconds.time(operation="make_password"):
+                User().set_password(password)
+            return None
+
+        with hashing_seconds.time(operation="check_password"):
+            valid = user.check_password(password)
+        # Inactive users are returned too, so the login can tell them their
+        # account is disabled rather than that their password is wrong.
+        return user if valid else None
+
+    async def aauthenticate(self, request, email=None, password=None, **kwargs):
+        """
+        Same as authenticate(), with the hashing on the pool in
+        accounts.hashing so the event loop stays free.
+        """
+        if email is None or password is None:
+            return None
+
+        user = await sync_to_async(users_with_email(email).order_by("pk").first)()
+        if user is None:
+            await amake_password(password)
+            return None
+
+        if not await acheck_password(password, user.password):
+            return None
+        if password_needs_update(user.password):
+            # What check_password()'s setter does in authenticate().
+            user.password = await amake_password(password)
+            await sync_to_async(user.save)(update_fields=["password"])
+        return user
+
+
+async def aauthenticate(request=None, **credentials):
+    """
+    Async version of django.contrib.auth.authenticate(): tries each of
+    AUTHENTICATION_BACKENDS in turn, awaiting the ones with an aauthenticate()
+    method and running the others in a thread, and sends user_login_failed
+    when none of them accepts the credentials.
+    """
+    for backend_path in settings.AUTHENTICATION_BACKENDS:
+        backend = load_backend(backend_path)
+        try:
+            inspect.signature(backend.authenticate).bind(request, **credentials)
+        except TypeError:
+            # This backend doesn't accept these credentials.
+            continue
+        try:
+            if hasattr(backend, "aauthenticate"):
+                user = await backend.aauthenticate(request, **credentials)
+            else:
+                user = await sync_to_async(backend.authenticate)(request, **credentials)
+        except PermissionDenied:
+            # This backend says to stop in our tracks.
+            break
+        if user is None:
+            continue
+        user.backend = backend_path
+        return user
+
+    await sync_to_async(user_login_failed.send)(
+        sender="django.contrib.auth",
+        credentials=_clean_credentials(credentials),
+        request=request,
+    )
+    return None
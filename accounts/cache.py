@@ -0,0 +1,95 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+
+from userhub.caches import get_shared_cache
+
+USER_VERSION_KEY = "accounts:user-version:{}"
+
+
+class UserCache:
+    """
+    Bounded, thread-safe LRU of user objects with a time-to-live.
+
+    Each entry remembers the version stamp it was loaded under and is only
+    returned while that stamp is still current, so bumping the stamp in the
+    AUTH_USER_CACHE_ALIAS cache, shared by the workers, invalidates the entry
+    in every process.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, entry_version, expires_at = entry
+            if entry_version != version or expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user, version):
+        with self._lock:
+            self._entries[user_id] = (user, version, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    max_entries=settings.AUTH_USER_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_USER_CACHE_TTL,
+)
+
+
+def get_version_cache():
+    """
+    Returns the cache holding version stamps, or None when it is not shared
+    by the workers. A stamp bumped in one process would then leave stale
+    copies in the others, so users are not cached at all.
+    """
+    return get_shared_cache(settings.AUTH_USER_CACHE_ALIAS)
+
+
+def get_user_version(user_id):
+    """
+    Returns the current version stamp for a user, creating one if needed,
+    or None if users are not cached.
+    """
+    cache = get_version_cache()
+    if cache is None:
+        return None
+    key = USER_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user(user_id):
+    """
+    Drops every cached copy of a user by retiring its version stamp.
+    """
+    cache = get_version_cache()
+    if cache is not None:
+        cache.delete(USER_VERSION_KEY.format(user_id))
+    user_cache.discard(user_id)
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    check_password,
+    get_hasher,
+    identify_hasher,
+    make_password,
+)
+
+from userhub import metrics
+
+hashing_seconds = metrics.histogram(
+    "userhub_password_hashing_seconds",
+    "Time to hash or verify a password, including any wait for the pool.",
+    ["operation"],
+)
+hashing_pending = metrics.gauge(
+    "userhub_password_hashing_pending", "Hashing calls queued or running."
+)
+
+
+class HashingPoolBusy(Exception):
+    """
+    Raised when too many hashing calls are already queued.
+    """
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def get_executor():
+    """
+    Returns the shared hashing process pool, or None when
+    PASSWORD_HASHING_POOL_SIZE is 0 and hashing runs in threads instead.
+    """
+    global _executor
+    if not settings.PASSWORD_HASHING_POOL_SIZE:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_POOL_SIZE,
+                initializer=_init_worker,
+            )
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def pending_count():
+    return _pending
+
+
+async def run_hasher(func, *args):
+    """
+    Runs a hashing function on the pool without blocking the event loop.
+
+    Raises HashingPoolBusy instead of queueing once
+    PASSWORD_HASHING_MAX_PENDING calls are already in flight.
+    """
+    global _pending
+    with _pending_lock:
+        if _pending >= settings.PASSWORD_HASHING_MAX_PENDING:
+            raise HashingPoolBusy()
+        _pending += 1
+        hashing_pending.set(_pending)
+    try:
+        with hashing_seconds.time(operation=func.__name__):
+            executor = get_executor()
+            if executor is None:
+                return await sync_to_async(func, thread_sensitive=False)(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, func, *args)
+    finally:
+        with _pending_lock:
+            _pending -= 1
+            hashing_pending.set(_pending)
+
+
+async def acheck_password(password, encoded):
+    return await run_hasher(check_password, password, encoded)
+
+
+async def amake_password(password):
+    return await run_hasher(make_password, password)
+
+
+def password_needs_update(encoded):
+    """
+    Returns True if ``encoded`` should be rehashed with the preferred hasher,
+    as check_password() decides before calling its setter.
+    """
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = get_hasher()
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def make_passwords(passwords):
+    """
+    Hashes a batch of passwords, spread across the pool's processes.
+    """
+    executor = get_executor()
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (settings.PASSWORD_HASHING_POOL_SIZE * 4))
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
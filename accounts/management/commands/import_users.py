@@ -0,0 +1,231 @@
+import csv
+import json
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_date
+
+from accounts.hashing import make_passwords
+from accounts.models import UserProfile
+
+PROFILE_FIELDS = ["full_name", "date_of_birth", "address", "gender", "mobile_number"]
+GENDERS = {choice for choice, _ in UserProfile.GENDER_CHOICES}
+MAX_LENGTHS = {
+    field: UserProfile._meta.get_field(field).max_length for field in PROFILE_FIELDS
+}
+
+
+def text(value, strip=True):
+    """
+    Returns a CSV or NDJSON value as a string, or None if it is not one.
+    Numbers are converted, since NDJSON files often hold phone numbers as such.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        return None
+    return value.strip() if strip else value
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports users from a CSV or NDJSON file with columns email, password "
+        "and optionally full_name, date_of_birth, address, gender, mobile_number."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or NDJSON file to import.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "ndjson"],
+            help="Input format. Guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows hashed and written per transaction (default 1000).",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help=(
+                "File recording the last committed row. When it exists, rows up "
+                "to that point are skipped, so an interrupted import can resume."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"] or (
+            "csv" if path.lower().endswith(".csv") else "ndjson"
+        )
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        checkpoint = options["checkpoint"]
+        start_after = 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                start_after = int(f.read().strip() or 0)
+            self.stdout.write(f"Resuming after row {start_after}.")
+
+        self.imported = self.skipped = self.failed = 0
+        self.seen = set()
+        started = time.monotonic()
+
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                batch = []
+                for number, row in self.read_rows(f, input_format):
+                    if number <= start_after:
+                        continue
+                    batch.append((number, row))
+                    if len(batch) >= batch_size:
+                        self.write_batch(batch, checkpoint, started)
+                        batch = []
+                if batch:
+                    self.write_batch(batch, checkpoint, started)
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+        elapsed = time.monotonic() - started
+        rate = self.imported / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {self.imported} users in {elapsed:.1f}s ({rate:.0f}/s); "
+                f"{self.skipped} already existed, {self.failed} invalid."
+            )
+        )
+
+    def read_rows(self, f, input_format):
+        """
+        Yields (row number, dict) pairs without loading the whole file.
+        """
+        if input_format == "csv":
+            yield from enumerate(csv.DictReader(f), start=1)
+            return
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else {}
+
+    def clean_row(self, number, row):
+        email = text(row.get("email"))
+        password = text(row.get("password"), strip=False)
+        try:
+            validate_email(email)
+        except ValidationError:
+            return self.reject(number, "invalid email")
+        if not password:
+            return self.reject(number, "missing password")
+
+        profile = {}
+        for field in PROFILE_FIELDS:
+            value = text(row.get(field))
+            if value is None:
+                return self.reject(number, f"invalid {field}")
+            if MAX_LENGTHS[field] and len(value) > MAX_LENGTHS[field]:
+                return self.reject(
+                    number, f"{field} longer than {MAX_LENGTHS[field]} characters"
+                )
+            profile[field] = value
+        if profile["date_of_birth"]:
+            try:
+                profile["date_of_birth"] = parse_date(profile["date_of_birth"])
+            except ValueError:
+                profile["date_of_birth"] = None
+            if profile["date_of_birth"] is None:
+                return self.reject(number, "invalid date_of_birth")
+        else:
+            profile["date_of_birth"] = None
+        if profile["gender"] and profile["gender"] not in GENDERS:
+            return self.reject(number, "invalid gender")
+        return email, password, profile
+
+    def reject(self, number, reason):
+        self.failed += 1
+        self.stderr.write(f"Row {number}: {reason}")
+        return None
+
+    def write_batch(self, batch, checkpoint, started):
+        rows = {}
+        for number, row in batch:
+            cleaned = self.clean_row(number, row)
+            if cleaned is None:
+                continue
+            key = cleaned[0].lower()
+            if key in self.seen or key in rows:
+                self.skipped += 1
+                continue
+            rows[key] = cleaned
+
+        # Served by the LOWER(email) index (see accounts.backends).
+        existing = set(
+            User.objects.annotate(email_lower=Lower("email"))
+            .filter(email_lower__in=list(rows))
+            .values_list("email_lower", flat=True)
+        )
+        # Usernames are unique too, and keep a user's first email when the
+        # email is changed, so they can clash with a free email.
+        usernames = {key: User.normalize_username(row[0]) for key, row in rows.items()}
+        taken = set(
+            User.objects.filter(username__in=list(usernames.values())).values_list(
+                "username", flat=True
+            )
+        )
+        existing.update(key for key, name in usernames.items() if name in taken)
+        self.skipped += len(rows.keys() & existing)
+        rows = {key: row for key, row in rows.items() if key not in existing}
+        self.seen.update(rows)
+
+        hashes = make_passwords([password for _, password, _ in rows.values()])
+        users = []
+        for (key, (email, _, _)), encoded in zip(rows.items(), hashes):
+            users.append(
+                User(
+                    username=usernames[key],
+                    email=User.objects.normalize_email(email),
+                    password=encoded,
+                )
+            )
+
+        # bulk_create() skips post_save, so profiles are written here too.
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+            if users and users[0].pk is None:
+                # Backends that cannot return ids from a bulk insert.
+                ids = dict(
+                    User.objects.filter(
+                        username__in=[user.username for user in users]
+                    ).values_list("username", "pk")
+                )
+                for user in users:
+                    user.pk = ids[user.username]
+            UserProfile.objects.bulk_create(
+                UserProfile(user=user, **profile)
+                for user, (_, _, profile) in zip(users, rows.values())
+            )
+
+        if checkpoint:
+            with open(checkpoint, "w") as f:
+                f.write(str(batch[-1][0]))
+
+        self.imported += len(users)
+        elapsed = time.monotonic() - started
+        rate = self.imported / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Row {batch[-1][0]}: {self.imported} imported ({rate:.0f} users/s)"
+        )
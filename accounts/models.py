@@ -1,8 +1,10 @@
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .cache import invalidate_user
+
 
 class UserProfile(models.Model):
     GENDER_CHOICES = [
@@ -29,8 +31,28 @@ class UserProfile(models.Model):
         verbose_name_plural = "User Profiles"
 
 
+class RevokedToken(models.Model):
+    """
+    A revoked refresh token id, kept until the token expires
+    (accounts.revocation.DatabaseRevocationStore).
+    """
+
+    jti = models.CharField(max_length=255, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
 # Signal to create profile when user is created
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+
+
+# Signal to drop cached copies used by CachedJWTAuthentication
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
@@ -0,0 +1,183 @@
+"""
+Revocation of refresh tokens by jti.
+
+Revoked jtis only need remembering until the token would have expired
+anyway, so the stores drop entries at the token's ``exp``: nothing grows
+without bound and a refresh costs a single write. The store in use is
+chosen with the TOKEN_REVOCATION_STORE setting. A store must never forget
+an entry early, or the revoked token becomes valid again, which rules out
+caches that evict entries to make room.
+
+``revoke()`` returns False when the jti was already revoked, which lets
+rotation claim a refresh token atomically so it can only be used once.
+"""
+
+import heapq
+import threading
+import time
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import IntegrityError, router, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+REVOKED_KEY = "accounts:revoked-jti:{}"
+
+
+class MemoryRevocationStore:
+    """
+    Revoked jtis kept in this process: a dict for O(1) lookups and a heap
+    ordered by expiry, from which expired entries are pruned on every write.
+
+    Only suitable when a single process serves the API.
+    """
+
+    def __init__(self):
+        self._expiry = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, exp):
+        with self._lock:
+            self._prune()
+            if jti in self._expiry:
+                return False
+            if exp > time.time():
+                self._expiry[jti] = exp
+                heapq.heappush(self._heap, (exp, jti))
+            return True
+
+    def is_revoked(self, jti):
+        exp = self._expiry.get(jti)
+        return exp is not None and exp > time.time()
+
+    def _prune(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, jti = heapq.heappop(self._heap)
+            del self._expiry[jti]
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def clear(self):
+        with self._lock:
+            self._expiry.clear()
+            self._heap.clear()
+
+
+class DatabaseRevocationStore:
+    """
+    Revoked jtis kept in the RevokedToken table, looked up by primary key.
+    Expired rows are deleted at most every ``prune_interval`` seconds per
+    process, on a write.
+    """
+
+    prune_interval = 60
+
+    def __init__(self):
+        self._last_prune = 0
+
+    @property
+    def db(self):
+        # Reads go to the primary too: a lagging replica would miss a
+        # revocation made moments ago.
+        return router.db_for_write(RevokedToken)
+
+    def revoke(self, jti, exp):
+        now = time.time()
+        if exp <= now:
+            return True
+        if now - self._last_prune >= self.prune_interval:
+            self._last_prune = now
+            RevokedToken.objects.using(self.db).filter(
+                expires_at__lte=timezone.now()
+            ).delete()
+        try:
+            with transaction.atomic(using=self.db):
+                RevokedToken.objects.using(self.db).create(
+                    jti=jti, expires_at=datetime.fromtimestamp(exp, dt_timezone.utc)
+                )
+        except IntegrityError:
+            return False
+        return True
+
+    def is_revoked(self, jti):
+        return (
+            RevokedToken.objects.using(self.db)
+            .filter(jti=jti, expires_at__gt=timezone.now())
+            .exists()
+        )
+
+
+class CacheRevocationStore:
+    """
+    Revoked jtis kept in the TOKEN_REVOCATION_CACHE cache with a timeout
+    matching the token's remaining lifetime, so the cache drops them on
+    expiry. The cache must be shared between workers and must not evict
+    live keys, e.g. Redis with ``maxmemory-policy noeviction``; Django's
+    local-memory, file, database and Memcached backends cull entries when
+    full and are refused.
+    """
+
+    evicting_backends = (LocMemCache, FileBasedCache, DatabaseCache, BaseMemcachedCache)
+
+    def __init__(self, alias=None):
+        alias = alias or settings.TOKEN_REVOCATION_CACHE
+        self.cache = caches[alias]
+        if isinstance(self.cache, self.evicting_backends):
+            raise ImproperlyConfigured(
+                f"The {alias!r} cache evicts entries when full, which would "
+                "make revoked tokens valid again. Use DatabaseRevocationStore "
+                "or a cache that never evicts."
+            )
+
+    def revoke(self, jti, exp):
+        timeout = int(exp - time.time()) + 1
+        if timeout <= 0:
+            return True
+        return self.cache.add(REVOKED_KEY.format(jti), 1, timeout)
+
+    def is_revoked(self, jti):
+        return self.cache.get(REVOKED_KEY.format(jti)) is not None
+
+
+_store = None
+
+
+def get_revocation_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.TOKEN_REVOCATION_STORE)()
+    return _store
+
+
+@receiver(setting_changed)
+def reset_revocation_store(setting, **kwargs):
+    global _store
+    if setting in ("TOKEN_REVOCATION_STORE", "TOKEN_REVOCATION_CACHE"):
+        _store = None
+
+
+def revoke_token(token):
+    """
+    Revokes a refresh token until it expires. Returns False if it already was.
+    """
+    return get_revocation_store().revoke(token[api_settings.JTI_CLAIM], token["exp"])
+
+
+def is_token_revoked(token):
+    return get_revocation_store().is_revoked(token[api_settings.JTI_CLAIM])
@@ -1,9 +1,16 @@
-from django.contrib.auth import authenticate
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 
+from .backends import users_with_email
 from .models import UserProfile
+from .revocation import is_token_revoked, revoke_token
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -32,18 +39,24 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return attrs
 
     def validate_email(self, value):
-        if User.objects.filter(email__iexact=value).exists():
+        if users_with_email(value).exists():
             raise serializers.ValidationError("A user with this email already exists.")
         return value
 
     def create(self, validated_data):
         full_name = validated_data.pop("full_name", "")
         validated_data.pop("password_confirm")
+        password = validated_data.pop("password")
+        # The async view hashes the password off the event loop beforehand
+        encoded_password = validated_data.pop("encoded_password", None)
 
         # Use email as username
-        user = User.objects.create_user(
-            username=validated_data["email"], **validated_data
+        email = User.objects.normalize_email(validated_data["email"])
+        user = User(
+            username=User.normalize_username(validated_data["email"]), email=email
         )
+        user.password = encoded_password or make_password(password)
+        user.save()
 
         # Update profile if full_name is provided
         if full_name:
@@ -53,22 +66,21 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class UserLoginSerializer(serializers.Serializer):
+class LoginCredentialsSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(style={"input_type": "password"})
 
+
+class UserLoginSerializer(LoginCredentialsSerializer):
     def validate(self, attrs):
         email = attrs.get("email")
         password = attrs.get("password")
 
         if email and password:
-            # We need to find the user by email first, then authenticate
-            try:
-                user_obj = User.objects.get(email__iexact=email)
-            except User.DoesNotExist:
-                raise serializers.ValidationError("Invalid credentials")
-
-            user = authenticate(username=user_obj.username, password=password)
+            # EmailBackend resolves the user by email in a single query
+            user = authenticate(
+                request=self.context.get("request"), email=email, password=password
+            )
             if not user:
                 raise serializers.ValidationError("Invalid credentials")
             if not user.is_active:
@@ -105,7 +117,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         """
         # The user is available in the context when updating
         user = self.context["request"].user
-        if User.objects.filter(email__iexact=value).exclude(pk=user.pk).exists():
+        if users_with_email(value).exclude(pk=user.pk).exists():
             raise serializers.ValidationError("A user with this email already exists.")
         return value
 
@@ -138,7 +150,48 @@ class PasswordResetSerializer(serializers.Serializer):
         return attrs
 
     def validate_old_password(self, value):
+        # The async view verifies the old password on the hashing pool
+        if self.context.get("old_password_checked"):
+            return value
         user = self.context["request"].user
         if not user.check_password(value):
             raise serializers.ValidationError("Invalid old password")
         return value
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh checked against ``accounts.revocation`` instead of the
+    token_blacklist tables. With rotation on, the presented token is revoked
+    as it is exchanged, so each refresh token works once.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # Claiming the token is atomic, so concurrent reuse fails too.
+            revoked = not revoke_token(refresh)
+        else:
+            revoked = is_token_revoked(refresh)
+        if revoked:
+            raise InvalidToken(_("Token is blacklisted"))
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            user = (
+                get_user_model()
+                .objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .first()
+            )
+            if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(
+                    self.error_messages["no_active_account"], "no_active_account"
+                )
+
+        data = {"access": str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
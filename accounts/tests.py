@@ -1,7 +1,36 @@
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import async_views, hashing
+from .authentication import CachedJWTAuthentication
+from .backends import EMAIL_INDEX, users_with_email
+from .cache import user_cache
+from .models import RevokedToken, UserProfile
+from .revocation import (
+    CacheRevocationStore,
+    DatabaseRevocationStore,
+    MemoryRevocationStore,
+    get_revocation_store,
+)
+from .serializers import UserLoginSerializer, UserRegistrationSerializer
 
 
 class AccountTests(TestCase):
@@ -29,3 +58,427 @@ class AccountTests(TestCase):
         response = self.client.post("/api/auth/login/", data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("access", response.data)
+
+
+@override_settings(
+    CACHES={
+        **settings.CACHES,
+        "shared": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(tempfile.gettempdir(), "userhub-tests-shared"),
+        },
+    },
+    AUTH_USER_CACHE_ALIAS="shared",
+)
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        caches["shared"].clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            username="test@example.com",
+            email="test@example.com",
+            password="testpass123",
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.request = RequestFactory().get(
+            "/api/tasks/", HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+        self.authentication = CachedJWTAuthentication()
+
+    def test_cached_user_needs_no_query(self):
+        self.authentication.authenticate(self.request)
+        with self.assertNumQueries(0):
+            user, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(user, self.user)
+
+    def test_user_changes_invalidate_cache(self):
+        self.authentication.authenticate(self.request)
+        self.user.first_name = "Changed"
+        self.user.save()
+        user, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(user.first_name, "Changed")
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(self.request)
+
+    def test_users_are_not_cached_without_a_shared_cache(self):
+        # Another worker could not see the version stamp bumped here.
+        with self.settings(AUTH_USER_CACHE_ALIAS="default"):
+            self.authentication.authenticate(self.request)
+            with self.assertNumQueries(1):
+                self.authentication.authenticate(self.request)
+
+
+class EmailLoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="test@example.com",
+            email="Test@Example.com",
+            password="testpass123",
+        )
+
+    def test_login_is_case_insensitive_and_single_query(self):
+        serializer = UserLoginSerializer(
+            data={"email": "TEST@example.COM", "password": "testpass123"}
+        )
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data["user"], self.user)
+
+    def test_login_with_wrong_password(self):
+        serializer = UserLoginSerializer(
+            data={"email": "test@example.com", "password": "wrongpass"}
+        )
+        self.assertFalse(serializer.is_valid())
+
+    def test_email_lookup_uses_index(self):
+        sql, params = users_with_email("test@example.com").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn(EMAIL_INDEX.name, plan)
+
+    def test_registration_rejects_duplicate_email(self):
+        serializer = UserRegistrationSerializer(
+            data={
+                "email": "TEST@EXAMPLE.COM",
+                "password": "newpass123",
+                "password_confirm": "newpass123",
+            }
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("email", serializer.errors)
+
+
+@override_settings(PASSWORD_HASHING_POOL_SIZE=0, PASSWORD_HASHING_MAX_PENDING=4)
+class AsyncAuthViewTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(
+            username="test@example.com",
+            email="test@example.com",
+            password="testpass123",
+        )
+
+    def post(self, view, data, **extra):
+        request = self.factory.post(
+            "/", json.dumps(data), content_type="application/json", **extra
+        )
+        response = async_to_sync(view.as_view())(request)
+        return response, json.loads(response.content)
+
+    def test_async_login(self):
+        response, data = self.post(
+            async_views.LoginView,
+            {"email": "TEST@example.com", "password": "testpass123"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("access", data)
+
+        response, data = self.post(
+            async_views.LoginView,
+            {"email": "test@example.com", "password": "wrongpass"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_async_login_goes_through_the_backends(self):
+        failed = []
+
+        def on_failure(sender, credentials, **kwargs):
+            failed.append(credentials)
+
+        user_login_failed.connect(on_failure)
+        self.addCleanup(user_login_failed.disconnect, on_failure)
+        response, data = self.post(
+            async_views.LoginView,
+            {"email": "test@example.com", "password": "wrongpass"},
+        )
+        self.assertEqual(data, {"non_field_errors": ["Invalid credentials"]})
+        self.assertEqual(failed[0]["email"], "test@example.com")
+
+        # Passwords stored with an outdated hasher are upgraded.
+        self.user.password = make_password("testpass123", hasher="pbkdf2_sha1")
+        self.user.save()
+        response, data = self.post(
+            async_views.LoginView,
+            {"email": "test@example.com", "password": "testpass123"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+
+    def test_async_login_rejects_disabled_users_like_the_sync_login(self):
+        self.user.is_active = False
+        self.user.save()
+        credentials = {"email": "test@example.com", "password": "testpass123"}
+        response, data = self.post(async_views.LoginView, credentials)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        serializer = UserLoginSerializer(data=credentials)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(data, serializer.errors)
+        self.assertEqual(data, {"non_field_errors": ["User account is disabled"]})
+
+    def test_async_registration(self):
+        response, data = self.post(
+            async_views.RegisterView,
+            {
+                "email": "newuser@example.com",
+                "password": "newpass123",
+                "password_confirm": "newpass123",
+                "full_name": "New User",
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user = User.objects.get(email="newuser@example.com")
+        self.assertTrue(user.check_password("newpass123"))
+        self.assertEqual(user.profile.full_name, "New User")
+
+    def test_async_password_reset(self):
+        token = RefreshToken.for_user(self.user).access_token
+        response, data = self.post(
+            async_views.PasswordResetView,
+            {
+                "old_password": "testpass123",
+                "new_password": "brandnew456",
+                "new_password_confirm": "brandnew456",
+            },
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("brandnew456"))
+
+    @override_settings(PASSWORD_HASHING_MAX_PENDING=0)
+    def test_saturated_pool_sheds_load(self):
+        response, data = self.post(
+            async_views.LoginView,
+            {"email": "test@example.com", "password": "testpass123"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "1")
+
+
+class HashingPoolTests(SimpleTestCase):
+    @override_settings(PASSWORD_HASHING_POOL_SIZE=1, PASSWORD_HASHING_MAX_PENDING=4)
+    def test_hashing_on_process_pool(self):
+        self.addCleanup(hashing.shutdown_executor)
+        encoded = async_to_sync(hashing.amake_password)("pool-password")
+        self.assertTrue(
+            async_to_sync(hashing.acheck_password)("pool-password", encoded)
+        )
+        self.assertEqual(hashing.pending_count(), 0)
+
+
+@override_settings(PASSWORD_HASHING_POOL_SIZE=0)
+class ImportUsersCommandTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(
+            username="existing@example.com",
+            email="existing@example.com",
+            password="testpass123",
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_import_csv(self):
+        path = self.write(
+            "users.csv",
+            "email,password,full_name,gender\n"
+            "alice@example.com,alicepass1,Alice,F\n"
+            "EXISTING@example.com,whatever1,,\n"
+            "not-an-email,secret123,,\n"
+            "bob@example.com,bobpass123,Bob,M\n",
+        )
+        call_command("import_users", path, stdout=StringIO(), stderr=StringIO())
+
+        alice = User.objects.get(email="alice@example.com")
+        self.assertTrue(alice.check_password("alicepass1"))
+        self.assertEqual(alice.profile.full_name, "Alice")
+        self.assertEqual(User.objects.get(email="bob@example.com").profile.gender, "M")
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_import_ndjson_resumes_from_checkpoint(self):
+        lines = [
+            json.dumps({"email": f"user{i}@example.com", "password": "secret123"})
+            for i in range(5)
+        ]
+        path = self.write("users.ndjson", "\n".join(lines) + "\n")
+        checkpoint = self.write("checkpoint", "2")
+
+        out = StringIO()
+        call_command(
+            "import_users", path, batch_size=2, checkpoint=checkpoint, stdout=out
+        )
+        emails = set(User.objects.values_list("email", flat=True))
+        self.assertNotIn("user1@example.com", emails)
+        self.assertIn("user4@example.com", emails)
+        self.assertTrue(UserProfile.objects.filter(user__email="user4@example.com"))
+        with open(checkpoint) as f:
+            self.assertEqual(f.read(), "5")
+        self.assertIn("Imported 3 users", out.getvalue())
+
+    def test_import_skips_taken_usernames(self):
+        # Usernames keep the first email after the email is changed.
+        User.objects.create_user(
+            username="moved@example.com", email="new@example.com", password="x"
+        )
+        path = self.write(
+            "users.csv",
+            "email,password\nmoved@example.com,secret123\nfresh@example.com,secret123\n",
+        )
+        out = StringIO()
+        call_command("import_users", path, stdout=out, stderr=StringIO())
+        self.assertTrue(User.objects.filter(email="fresh@example.com").exists())
+        self.assertFalse(User.objects.filter(email="moved@example.com").exists())
+        self.assertIn("Imported 1 users", out.getvalue())
+        self.assertIn("1 already existed", out.getvalue())
+
+    def test_import_rejects_malformed_values(self):
+        rows = [
+            {"email": "alice@example.com", "password": 12345678, "mobile_number": 555},
+            {"email": ["bob@example.com"], "password": "secret123"},
+            {"email": "carol@example.com", "password": "secret123", "address": {}},
+            {"email": "dave@example.com", "password": "x", "full_name": "D" * 101},
+            {"email": "erin@example.com", "password": "x", "mobile_number": "5" * 16},
+        ]
+        path = self.write("users.ndjson", "\n".join(map(json.dumps, rows)) + "\n")
+
+        err = StringIO()
+        call_command("import_users", path, stdout=StringIO(), stderr=err)
+        alice = User.objects.get(email="alice@example.com")
+        self.assertTrue(alice.check_password("12345678"))
+        self.assertEqual(alice.profile.mobile_number, "555")
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(
+            err.getvalue().splitlines(),
+            [
+                "Row 2: invalid email",
+                "Row 3: invalid address",
+                "Row 4: full_name longer than 100 characters",
+                "Row 5: mobile_number longer than 15 characters",
+            ],
+        )
+
+
+class ProfileConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="test@example.com",
+            email="test@example.com",
+            password="testpass123",
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_profile_conditional_get(self):
+        etag = self.client.get("/api/auth/profile/")["ETag"]
+        response = self.client.get("/api/auth/profile/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(
+            "/api/auth/profile/", {"full_name": "Changed Name"}, format="json"
+        )
+        response = self.client.get("/api/auth/profile/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["full_name"], "Changed Name")
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="test@example.com",
+            email="test@example.com",
+            password="testpass123",
+        )
+        self.refresh = str(RefreshToken.for_user(self.user))
+
+    def refresh_token(self, token):
+        return self.client.post(
+            "/api/auth/token/refresh/", {"refresh": token}, format="json"
+        )
+
+    def test_rotated_token_cannot_be_reused(self):
+        response = self.refresh_token(self.refresh)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("access", response.data)
+        rotated = response.data["refresh"]
+        self.assertNotEqual(rotated, self.refresh)
+
+        response = self.refresh_token(self.refresh)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh_token(rotated).status_code, status.HTTP_200_OK)
+
+    @override_settings(
+        TOKEN_REVOCATION_STORE="accounts.revocation.MemoryRevocationStore"
+    )
+    def test_logout_revokes_refresh_token(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            "/api/auth/logout/", {"refresh": self.refresh}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(get_revocation_store()), 1)
+        response = self.refresh_token(self.refresh)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        other = User.objects.create_user(username="other", password="testpass123")
+        response = self.client.post(
+            "/api/auth/logout/",
+            {"refresh": str(RefreshToken.for_user(other))},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revocations_are_never_evicted(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post("/api/auth/logout/", {"refresh": self.refresh}, format="json")
+        # More than a LocMemCache holds (MAX_ENTRIES=300) before culling.
+        store = get_revocation_store()
+        for n in range(400):
+            store.revoke(f"other-{n}", time.time() + 3600)
+        response = self.refresh_token(self.refresh)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_database_store_prunes_expired_entries(self):
+        store = DatabaseRevocationStore()
+        now = time.time()
+        self.assertTrue(store.revoke("old", now + 0.05))
+        self.assertTrue(store.revoke("new", now + 3600))
+        self.assertFalse(store.revoke("new", now + 3600))
+        self.assertTrue(store.is_revoked("old"))
+
+        time.sleep(0.06)
+        self.assertFalse(store.is_revoked("old"))
+        store._last_prune = 0
+        store.revoke("newer", now + 3600)
+        self.assertCountEqual(
+            RevokedToken.objects.values_list("jti", flat=True), ["new", "newer"]
+        )
+
+    def test_cache_store_refuses_evicting_caches(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CacheRevocationStore("default")
+
+    def test_memory_store_prunes_expired_entries(self):
+        store = MemoryRevocationStore()
+        now = time.time()
+        self.assertTrue(store.revoke("old", now + 0.05))
+        self.assertTrue(store.revoke("new", now + 3600))
+        self.assertFalse(store.revoke("new", now + 3600))
+        self.assertTrue(store.is_revoked("old"))
+
+        time.sleep(0.06)
+        self.assertFalse(store.is_revoked("old"))
+        store.revoke("newer", now + 3600)
+        self.assertEqual(len(store), 2)
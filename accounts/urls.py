@@ -1,15 +1,26 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 
-from . import views
+from . import async_views, views
+
+if settings.ASYNC_AUTH_VIEWS:
+    # Hash passwords on the process pool instead of in the request worker
+    register_view = async_views.RegisterView.as_view()
+    login_view = async_views.LoginView.as_view()
+    reset_password_view = async_views.PasswordResetView.as_view()
+else:
+    register_view = views.RegisterView.as_view()
+    login_view = views.LoginView.as_view()
+    reset_password_view = views.PasswordResetView.as_view()
 
 urlpatterns = [
     # Authentication endpoints using Generic Views
-    path("register/", views.RegisterView.as_view(), name="register"),
-    path("login/", views.LoginView.as_view(), name="login"),
+    path("register/", register_view, name="register"),
+    path("login/", login_view, name="login"),
     path("logout/", views.logout_view, name="logout"),
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     # Profile management
     path("profile/", views.ProfileView.as_view(), name="profile"),
-    path("reset-password/", views.PasswordResetView.as_view(), name="reset_password"),
+    path("reset-password/", reset_password_view, name="reset_password"),
 ]
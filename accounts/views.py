@@ -3,9 +3,14 @@ from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from userhub.conditional import make_etag, not_modified_response, set_validators
+
 from .models import UserProfile
+from .revocation import revoke_token
 from .serializers import (
     PasswordResetSerializer,
     UserLoginSerializer,
@@ -73,6 +78,24 @@ class ProfileView(generics.RetrieveUpdateAPIView):
         profile, created = UserProfile.objects.get_or_create(user=self.request.user)
         return profile
 
+    def retrieve(self, request, *args, **kwargs):
+        updated_at = (
+            UserProfile.objects.filter(user=request.user)
+            .values_list("updated_at", flat=True)
+            .first()
+        )
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        # username and email live on the user, which is already loaded
+        user = request.user
+        etag = make_etag(user.pk, user.username, user.email, updated_at.isoformat())
+        response = not_modified_response(request, etag, updated_at)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+            set_validators(response, etag, updated_at)
+        return response
+
 
 class PasswordResetView(generics.GenericAPIView):
     """
@@ -99,14 +122,14 @@ class PasswordResetView(generics.GenericAPIView):
 @permission_classes([permissions.IsAuthenticated])
 def logout_view(request):
     """
-    Logout endpoint to blacklist refresh token
+    Logout endpoint to revoke the refresh token
     """
     try:
-        refresh_token = request.data["refresh"]
-        token = RefreshToken(refresh_token)
-        token.blacklist()
-        return Response(
-            {"message": "Successfully logged out"}, status=status.HTTP_200_OK
-        )
-    except Exception as e:
+        token = RefreshToken(request.data["refresh"])
+    except (KeyError, TypeError, TokenError):
         return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
+    if str(token.get(api_settings.USER_ID_CLAIM)) != str(request.user.pk):
+        return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
+
+    revoke_token(token)
+    return Response({"message": "Successfully logged out"}, status=status.HTTP_200_OK)
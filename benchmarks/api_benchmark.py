@@ -0,0 +1,353 @@
+"""
+Latency, throughput and query counts of the auth and task API endpoints.
+
+    python benchmarks/api_benchmark.py bench.sqlite3 [--output results.json]
+        [--baseline baseline.json] [--tolerance 0.2] [--scenario task_list ...]
+
+Runs against a database made by generate_data.py. Requests go through the
+full Django stack in-process (middleware, authentication, serialization) via
+the test client, so the numbers exclude network and server overhead but are
+stable enough to compare releases. Every scenario reports p50/p95/p99 and
+mean latency, requests per second and SQL queries per request.
+
+With --baseline, results are compared to an earlier --output file, and the
+exit status is 1 when a scenario's p95 grew by more than --tolerance or it
+issued more queries.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from common import ROOT, percentile, setup_django
+from generate_data import PASSWORD
+
+
+class Scenario:
+    """
+    One endpoint under test. ``request(client)`` is timed; ``prepare``
+    runs untimed before each request.
+    """
+
+    iterations = 200
+
+    def __init__(self, bench):
+        self.bench = bench
+        self.rng = bench.rng
+
+    def prepare(self):
+        pass
+
+    def request(self, client):
+        raise NotImplementedError
+
+
+class Login(Scenario):
+    # Dominated by password hashing, so fewer iterations.
+    iterations = 20
+
+    def request(self, client):
+        email = self.bench.random_user_email()
+        return client.post(
+            "/api/auth/login/",
+            {"email": email, "password": PASSWORD},
+            content_type="application/json",
+        )
+
+
+class TokenRefresh(Scenario):
+    def prepare(self):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        self.token = str(RefreshToken.for_user(self.bench.random_user()))
+
+    def request(self, client):
+        return client.post(
+            "/api/auth/token/refresh/",
+            {"refresh": self.token},
+            content_type="application/json",
+        )
+
+
+class TaskList(Scenario):
+    def prepare(self):
+        self.bench.authenticate(self.bench.random_user())
+
+    def request(self, client):
+        return client.get("/api/tasks/", **self.bench.auth)
+
+
+class TaskSearch(TaskList):
+    def request(self, client):
+        term = self.rng.choice(self.bench.words)
+        return client.get(f"/api/tasks/?search={term}", **self.bench.auth)
+
+
+class TaskPaginate(Scenario):
+    """
+    Walks cursor pages of one of the users with the most tasks.
+    """
+
+    def prepare(self):
+        if not getattr(self, "next_url", None):
+            self.bench.authenticate(self.bench.busy_user())
+            self.next_url = "/api/tasks/?pagination=cursor&page_size=20"
+
+    def request(self, client):
+        response = client.get(self.next_url, **self.bench.auth)
+        self.next_url = response.json().get("next")
+        return response
+
+
+class TaskCreate(Scenario):
+    def prepare(self):
+        self.bench.authenticate(self.bench.random_user())
+
+    def request(self, client):
+        return client.post(
+            "/api/tasks/",
+            {"title": "Benchmark task", "description": "Created by api_benchmark"},
+            content_type="application/json",
+            **self.bench.auth,
+        )
+
+
+class DeleteAll(Scenario):
+    """
+    Deletes a fresh batch of 1000 tasks per request, with the job run inline
+    so the whole deletion is timed.
+    """
+
+    iterations = 10
+    batch = 1000
+
+    def prepare(self):
+        from tasks.models import Task
+
+        user = self.bench.scratch_user()
+        Task.objects.bulk_create(
+            Task(user=user, title=f"Scratch {n}") for n in range(self.batch)
+        )
+        self.bench.authenticate(user)
+
+    def request(self, client):
+        return client.delete("/api/tasks/delete-all/", **self.bench.auth)
+
+
+SCENARIOS = {
+    "login": Login,
+    "token_refresh": TokenRefresh,
+    "task_list": TaskList,
+    "task_search": TaskSearch,
+    "task_paginate": TaskPaginate,
+    "task_create": TaskCreate,
+    "delete_all": DeleteAll,
+}
+
+
+class Benchmark:
+    def __init__(self, seed):
+        from django.contrib.auth.models import User
+        from django.db.models import Count
+        from generate_data import WORDS
+
+        self.rng = random.Random(seed)
+        self.words = WORDS
+        self.user_ids = list(
+            User.objects.filter(username__endswith="@bench.test").values_list(
+                "pk", flat=True
+            )
+        )
+        if not self.user_ids:
+            sys.exit("No benchmark users found; run generate_data.py first.")
+        self.busy_user_ids = list(
+            User.objects.filter(pk__in=self.user_ids[:2000])
+            .annotate(task_count=Count("tasks"))
+            .order_by("-task_count")
+            .values_list("pk", flat=True)[:10]
+        )
+        self.auth = {}
+
+    def random_user(self):
+        from django.contrib.auth.models import User
+
+        return User.objects.get(pk=self.rng.choice(self.user_ids))
+
+    def random_user_email(self):
+        return self.random_user().email
+
+    def busy_user(self):
+        from django.contrib.auth.models import User
+
+        return User.objects.get(pk=self.rng.choice(self.busy_user_ids))
+
+    def scratch_user(self):
+        from django.contrib.auth.models import User
+
+        user, _ = User.objects.get_or_create(
+            username="scratch@bench.invalid",
+            defaults={"email": "scratch@bench.invalid"},
+        )
+        return user
+
+    def authenticate(self, user):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+
+    def run(self, name, iterations=None):
+        from django.db import connections
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+
+        scenario = SCENARIOS[name](self)
+        iterations = iterations or scenario.iterations
+        client = Client(HTTP_HOST="localhost")
+        latencies, queries = [], []
+        started = time.perf_counter()
+        timed = 0.0
+        for _ in range(iterations):
+            scenario.prepare()
+            with ExitStack() as stack:
+                captures = [
+                    stack.enter_context(CaptureQueriesContext(connections[alias]))
+                    for alias in connections
+                ]
+                before = time.perf_counter()
+                response = scenario.request(client)
+                elapsed = time.perf_counter() - before
+            if response.status_code >= 400:
+                sys.exit(
+                    f"{name}: HTTP {response.status_code} {response.content[:200]}"
+                )
+            timed += elapsed
+            latencies.append(elapsed)
+            queries.append(sum(len(capture) for capture in captures))
+
+        latencies.sort()
+        return {
+            "iterations": iterations,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "mean_ms": statistics.fmean(latencies) * 1000,
+            "throughput_rps": iterations / timed,
+            "queries": statistics.fmean(queries),
+            "wall_seconds": time.perf_counter() - started,
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change against ``baseline`` and returns the regressed scenarios.
+    """
+    regressions = []
+    print(f"\nAgainst baseline {baseline['meta'].get('revision')}:")
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        change = current["p95_ms"] / previous["p95_ms"] - 1
+        extra_queries = current["queries"] - previous["queries"]
+        regressed = change > tolerance or extra_queries > 0.5
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<14} p95 {change:>+7.1%}  queries {extra_queries:>+5.1f}"
+            f"{'  REGRESSED' if regressed else ''}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("database", help="SQLite file made by generate_data.py.")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run; repeat for several. Defaults to all.",
+    )
+    parser.add_argument(
+        "--iterations", type=int, help="Requests per scenario (default varies)."
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against an earlier --output.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed p95 growth against the baseline (default 0.2, i.e. 20%%).",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django(args.database)
+    from django.conf import settings
+    from django.contrib.auth.models import User
+
+    from tasks.models import Task
+
+    # Run delete_all jobs inline so the request covers the whole deletion.
+    settings.TASK_JOBS_ALWAYS_EAGER = True
+    settings.TASK_DELETE_CHUNK_PAUSE = 0
+
+    bench = Benchmark(args.seed)
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "database_profile": settings.DATABASE_PROFILE,
+            "users": User.objects.count(),
+            "tasks": Task.objects.count(),
+        },
+        "scenarios": {},
+    }
+    print(
+        f"{results['meta']['users']} users, {results['meta']['tasks']} tasks\n"
+        f"{'scenario':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'req/s':>8} {'queries':>8}"
+    )
+    for name in args.scenario or SCENARIOS:
+        row = bench.run(name, args.iterations)
+        results["scenarios"][name] = row
+        print(
+            f"{name:<14} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+            f"{row['p99_ms']:>8.2f} {row['throughput_rps']:>8.1f} "
+            f"{row['queries']:>8.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
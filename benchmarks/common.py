@@ -0,0 +1,35 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+import math
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(database_path):
+    """
+    Configures Django against the SQLite file at ``database_path``.
+    """
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "userhub.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = database_path
+
+    import django
+
+    django.setup()
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
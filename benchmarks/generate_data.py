@@ -0,0 +1,138 @@
+"""
+Generates a benchmark database of users and tasks.
+
+    python benchmarks/generate_data.py bench.sqlite3 [--users 10000] [--tasks 1000000]
+
+Users are ``user<n>@bench.test`` with the password ``benchmark-password``
+and a profile each. Tasks are spread unevenly, as in real use: a few users
+own many tasks and most own a handful. Descriptions follow a long-tailed
+length distribution, and creation times cover the last year. The file is
+created from scratch; an existing one is replaced.
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import timedelta
+
+from common import setup_django
+
+PASSWORD = "benchmark-password"
+WORDS = (
+    "review update draft send call plan fix deploy check write report meeting "
+    "invoice design budget client release schedule notes follow-up migrate "
+    "backlog sprint test docs onboarding team quarterly weekly urgent later"
+).split()
+
+
+def description(rng):
+    if rng.random() < 0.1:
+        return ""
+    # Median around 120 characters, with a tail of multi-paragraph notes.
+    length = min(int(rng.lognormvariate(4.8, 1.0)), 8000)
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def generate_users(count, batch_size):
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+
+    from accounts.models import UserProfile
+
+    # One hash shared by every user; hashing 10k passwords would dominate.
+    encoded = make_password(PASSWORD)
+    for start in range(0, count, batch_size):
+        users = User.objects.bulk_create(
+            User(
+                username=f"user{n}@bench.test",
+                email=f"user{n}@bench.test",
+                password=encoded,
+            )
+            for n in range(start, min(start + batch_size, count))
+        )
+        UserProfile.objects.bulk_create(
+            UserProfile(user=user, full_name=f"Bench User {user.pk}") for user in users
+        )
+    return list(User.objects.order_by("pk").values_list("pk", flat=True))
+
+
+def generate_tasks(user_ids, count, batch_size, rng):
+    from django.db import connection, transaction
+    from django.utils import timezone
+
+    from tasks.models import Task
+
+    # Zipf-like ownership: the user at rank r gets a share of 1 / r**0.8.
+    weights = [1 / (rank**0.8) for rank in range(1, len(user_ids) + 1)]
+    owners = user_ids[:]
+    rng.shuffle(owners)
+
+    # Raw inserts keep the generated timestamps (auto_now_add would not).
+    fields = [Task._meta.get_field(name) for name in ("user", "title", "description")]
+    columns = [field.column for field in fields] + [
+        "attachment",
+        "created_at",
+        "updated_at",
+    ]
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        Task._meta.db_table, ", ".join(columns), ", ".join(["%s"] * len(columns))
+    )
+    now = timezone.now()
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        rows = []
+        for user_id in rng.choices(owners, weights=weights, k=size):
+            created = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            created = connection.ops.adapt_datetimefield_value(created)
+            rows.append(
+                [
+                    user_id,
+                    f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}",
+                    description(rng),
+                    "",
+                    created,
+                    created,
+                ]
+            )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        print(f"  {start + size} tasks", end="\r", flush=True)
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("database", help="SQLite file to create.")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    database = os.path.abspath(args.database)
+    if os.path.exists(database):
+        os.remove(database)
+    setup_django(database)
+    from django.core.management import call_command
+
+    started = time.monotonic()
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    user_ids = generate_users(args.users, args.batch_size)
+    print(f"Created {len(user_ids)} users.")
+    generate_tasks(user_ids, args.tasks, args.batch_size, random.Random(args.seed))
+    call_command("rebuild_task_search", verbosity=0)
+    print(
+        f"Created {args.tasks} tasks in {database} "
+        f"({time.monotonic() - started:.0f}s)."
+    )
+
+
+if __name__ == "__main__":
+    main()
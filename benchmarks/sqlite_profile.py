@@ -0,0 +1,165 @@
+"""
+Concurrent read/write throughput of the SQLite database profiles.
+
+    python benchmarks/sqlite_profile.py [--seconds 5] [--readers 8] [--writers 2]
+
+Each profile (DATABASE_PROFILE=development and production) runs in its own
+process against a fresh scratch database. Reader threads run the task list
+queries and writer threads create and update tasks; every operation is
+wrapped like a request, so connections are closed or reused exactly as
+CONN_MAX_AGE dictates. Reported are operations per second, p50/p95 latency
+and "database is locked" errors.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import percentile, setup_django
+
+PROFILES = ["development", "production"]
+
+
+def seed(users, tasks_per_user):
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    from tasks.models import Task
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    User.objects.bulk_create(
+        User(username=f"bench{i}", email=f"bench{i}@example.com") for i in range(users)
+    )
+    user_ids = list(User.objects.values_list("pk", flat=True))
+    Task.objects.bulk_create(
+        Task(user_id=user_id, title=f"Task {n}", description="Benchmark task")
+        for user_id in user_ids
+        for n in range(tasks_per_user)
+    )
+    return user_ids
+
+
+def read_op(user_ids):
+    from tasks.models import Task
+
+    tasks = Task.objects.filter(user_id=random.choice(user_ids))
+    tasks.count()
+    list(tasks.order_by("-created_at", "-id")[:20])
+
+
+def write_op(user_ids):
+    from django.db import transaction
+
+    from tasks.models import Task
+
+    with transaction.atomic():
+        task = Task.objects.create(user_id=random.choice(user_ids), title="New")
+        task.description = "Updated"
+        task.save(update_fields=["description", "updated_at"])
+
+
+def worker(op, user_ids, stop, results):
+    from django.db import OperationalError, close_old_connections
+
+    latencies, errors = [], 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        # Mirrors the request_started/request_finished connection handling.
+        close_old_connections()
+        try:
+            op(user_ids)
+        except OperationalError:
+            errors += 1
+        finally:
+            close_old_connections()
+        latencies.append(time.perf_counter() - started)
+    results.append((op.__name__, latencies, errors))
+
+
+def run_profile(args):
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(os.path.join(directory, "bench.sqlite3"))
+        user_ids = seed(args.users, args.tasks_per_user)
+
+        from django.db import connections
+
+        connections.close_all()
+        stop = threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=worker, args=(op, user_ids, stop, results))
+            for op, count in ((read_op, args.readers), (write_op, args.writers))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    report = {}
+    for name in ("read_op", "write_op"):
+        latencies = sorted(
+            latency for op, values, _ in results if op == name for latency in values
+        )
+        errors = sum(count for op, _, count in results if op == name)
+        report[name] = {
+            "ops_per_second": len(latencies) / args.seconds,
+            "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+            "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+            "locked_errors": errors,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks-per-user", type=int, default=200)
+    parser.add_argument("--profile", choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        # Child process: DATABASE_PROFILE is already in the environment.
+        print(json.dumps(run_profile(args)))
+        return
+
+    forwarded = sys.argv[1:]
+    print(
+        f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile"
+    )
+    print(
+        f"{'profile':<12} {'op':<6} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'locked':>7}"
+    )
+    for profile in PROFILES:
+        env = dict(os.environ, DATABASE_PROFILE=profile)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--profile", profile]
+            + forwarded,
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        for name, label in (("read_op", "read"), ("write_op", "write")):
+            row = report[name]
+            print(
+                f"{profile:<12} {label:<6} {row['ops_per_second']:>9.0f} "
+                f"{row['p50_ms'] or 0:>8.2f} {row['p95_ms'] or 0:>8.2f} "
+                f"{row['locked_errors']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
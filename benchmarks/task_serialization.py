@@ -0,0 +1,94 @@
+"""
+Per-row cost of encoding task list pages: TaskSerializer vs the values()
+fast path (tasks.encoders), and JSONRenderer vs FastJSONRenderer.
+
+    python benchmarks/task_serialization.py [--rows 100] [--repeat 200]
+
+Each variant fetches and encodes the same page from a scratch SQLite file;
+the script checks that both paths render byte-identical JSON.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import timeit
+
+from common import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100, help="Tasks per page.")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    # Removed when the script exits.
+    directory = tempfile.TemporaryDirectory(prefix="userhub-bench-")
+    setup_django(os.path.join(directory.name, "serialization.sqlite3"))
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from generate_data import description
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from tasks.encoders import compile_task_encoder
+    from tasks.models import Task
+    from tasks.serializers import TaskSerializer
+    from userhub.renderers import FastJSONRenderer, orjson
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    rng = random.Random(0)
+    user = User.objects.create_user("bench@bench.test", "bench@bench.test")
+    Task.objects.bulk_create(
+        Task(
+            user=user,
+            title=f"Task {n}",
+            description=description(rng),
+            attachment=(f"task_attachments/ab/cd/{n:064x}.png" if n % 4 == 0 else ""),
+        )
+        for n in range(args.rows)
+    )
+    request = Request(APIRequestFactory().get("/api/tasks/", HTTP_HOST="localhost"))
+    queryset = Task.objects.filter(user=user).order_by("-created_at")
+    fields = TaskSerializer.Meta.fields
+    columns = {"id", "created_at", *TaskSerializer.model_fields_for(fields)}
+
+    def serializer_path():
+        return TaskSerializer(
+            queryset.all(), many=True, context={"request": request}
+        ).data
+
+    def fast_path():
+        encode = compile_task_encoder(fields, request)
+        return [encode(row) for row in queryset.values(*columns)]
+
+    serialized, encoded = serializer_path(), fast_path()
+    if JSONRenderer().render(serialized) != FastJSONRenderer().render(encoded):
+        raise SystemExit("The fast path does not render the same bytes.")
+
+    def per_row(func):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        return best / args.rows * 1e6
+
+    results = [
+        ("fetch + TaskSerializer", per_row(serializer_path)),
+        ("fetch + values() encoder", per_row(fast_path)),
+        ("JSONRenderer", per_row(lambda: JSONRenderer().render(encoded))),
+        (
+            f"FastJSONRenderer ({'orjson' if orjson else 'json, orjson not installed'})",
+            per_row(lambda: FastJSONRenderer().render(encoded)),
+        ),
+    ]
+    print(f"{args.rows} rows, best of {args.repeat}; identical output: yes")
+    for name, micros in results:
+        print(f"  {name:<42} {micros:8.2f} µs/row")
+    print(
+        f"Encoding {results[0][1] / results[1][1]:.1f}x faster, "
+        f"rendering {results[2][1] / results[3][1]:.1f}x faster."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -75,9 +75,9 @@ function deleteAllTasks() {
             headers: {
                 'Authorization': 'Bearer ' + localStorage.getItem('access_token')
             },
-            success: function() {
-                loadTasks();
-                showToast('All tasks have been deleted.');
+            success: function(job) {
+                showToast('Deleting all tasks...');
+                waitForDeleteJob(job.status_url);
             },
             error: function(xhr) {
                 console.error('Error deleting all tasks:', xhr.responseText);
@@ -87,6 +87,31 @@ function deleteAllTasks() {
     }
 }
 
+function waitForDeleteJob(statusUrl) {
+    // delete-all runs as a background job; poll until it finishes.
+    $.ajax({
+        url: statusUrl,
+        method: 'GET',
+        headers: {
+            'Authorization': 'Bearer ' + localStorage.getItem('access_token')
+        },
+        success: function(job) {
+            if (job.status === 'pending' || job.status === 'running') {
+                setTimeout(function() { waitForDeleteJob(statusUrl); }, 1000);
+            } else if (job.status === 'done') {
+                loadTasks();
+                showToast('All tasks have been deleted.');
+            } else {
+                loadTasks();
+                showToast('Error deleting all tasks.', 'error');
+            }
+        },
+        error: function(xhr) {
+            console.error('Error checking delete job:', xhr.responseText);
+        }
+    });
+}
+
 function editTask(taskId) {
     // Fetch the specific task details to populate the form
     $.ajax({
@@ -104,8 +129,13 @@ function editTask(taskId) {
             
             const currentAttachment = $('#currentAttachment');
             if (task.attachment) {
-                const fileName = task.attachment.split('/').pop();
-                currentAttachment.html(`Current file: <a href="${task.attachment}" target="_blank">${fileName}</a>`);
+                // Stored files are named by their content; show the uploaded name.
+                const fileName = task.attachment_name || task.attachment.split('/').pop();
+                const link = $('<a href="#"></a>').text(fileName).on('click', function() {
+                    downloadAttachment(task.download_url);
+                    return false;
+                });
+                currentAttachment.text('Current file: ').append(link);
             } else {
                 currentAttachment.text('No attachment.');
             }
@@ -142,6 +172,52 @@ function updateTask(taskId, formData) {
     });
 }
 
+function loadThumbnails() {
+    // Thumbnails need the Authorization header, so they are fetched here
+    // instead of by the <img> tags themselves.
+    $('img.task-thumbnail[data-src]').each(function() {
+        const img = this;
+        const url = img.dataset.src;
+        img.removeAttribute('data-src');
+        fetch(url, {
+            headers: { 'Authorization': 'Bearer ' + localStorage.getItem('access_token') }
+        })
+            .then(response => response.ok ? response.blob() : Promise.reject(response.status))
+            .then(blob => {
+                img.onload = () => URL.revokeObjectURL(img.src);
+                img.src = URL.createObjectURL(blob);
+            })
+            .catch(() => $(img).remove());
+    });
+}
+
+function attachmentFileName(disposition) {
+    const match = /filename\*=UTF-8''([^;]+)|filename="([^"]+)"/.exec(disposition || '');
+    if (!match) {
+        return 'attachment';
+    }
+    return match[1] ? decodeURIComponent(match[1]) : match[2];
+}
+
+function downloadAttachment(url) {
+    // The download endpoint checks the task's owner, so the file is fetched
+    // with the Authorization header and saved from a blob URL.
+    fetch(url, {
+        headers: { 'Authorization': 'Bearer ' + localStorage.getItem('access_token') }
+    })
+        .then(response => response.ok ? response : Promise.reject(response.status))
+        .then(response => response.blob().then(blob => {
+            const link = document.createElement('a');
+            link.href = URL.createObjectURL(blob);
+            link.download = attachmentFileName(response.headers.get('Content-Disposition'));
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+            setTimeout(() => URL.revokeObjectURL(link.href), 0);
+        }))
+        .catch(() => showToast('Could not download the attachment.', 'error'));
+}
+
 function displayTasks(tasks) {
     const tableBody = $('#tasks-table-body');
     const noTasksMessage = $('#no-tasks-message');
@@ -154,8 +230,11 @@ function displayTasks(tasks) {
         $('#bulk-actions').show();
 
         tasks.forEach(function(task) {
+            const thumbnail = task.thumbnail_url
+                ? `<img class="task-thumbnail" data-src="${task.thumbnail_url}" alt="">`
+                : '';
             const attachmentLink = task.attachment 
-                ? `<a href="${task.attachment}" target="_blank" class="btn-link">View</a>` 
+                ? `${thumbnail}<a href="#" onclick="downloadAttachment('${task.download_url}'); return false;" class="btn-link">View</a>` 
                 : 'None';
             
             const row = `
@@ -174,6 +253,7 @@ function displayTasks(tasks) {
             `;
             tableBody.append(row);
         });
+        loadThumbnails();
     } else {
         tasksTable.hide();
         noTasksMessage.html('You have no tasks yet. Create one above!').show();
@@ -1,6 +1,38 @@
+from django.conf import settings
 from django.contrib import admin
 
-from .models import Task
+from .cache import invalidate_user_tasks
+from .models import Task, TaskDeletionJob
+from .sharding import shard_for_task_id, sharding_enabled
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """
+    Lists the tasks of one shard at a time; the first shard by default.
+    """
+
+    title = "shard"
+    parameter_name = "shard"
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.TASK_SHARDS]
+
+    def value(self):
+        return super().value() or settings.TASK_SHARDS[0]
+
+    def choices(self, changelist):
+        # Shards cannot be listed together, so there is no "All" choice.
+        for lookup, title in self.lookup_choices:
+            yield {
+                "selected": self.value() == lookup,
+                "query_string": changelist.get_query_string(
+                    {self.parameter_name: lookup}
+                ),
+                "display": title,
+            }
+
+    def queryset(self, request, queryset):
+        return queryset.using(self.value())
 
 
 @admin.register(Task)
@@ -12,4 +44,71 @@ class TaskAdmin(admin.ModelAdmin):
     list_display = ("title", "user", "created_at", "updated_at")
     search_fields = ("title", "description", "user__username")
     list_filter = ("user",)
+    readonly_fields = ("attachment_name", "created_at", "updated_at")
+
+    @property
+    def show_full_result_count(self):
+        # The unfiltered count would only cover the first shard.
+        return not sharding_enabled()
+
+    def get_list_filter(self, request):
+        if sharding_enabled():
+            return (ShardListFilter,) + tuple(self.list_filter)
+        return self.list_filter
+
+    def get_search_fields(self, request):
+        if sharding_enabled():
+            # Users live on "default" only, so shards cannot join them.
+            return ("title", "description")
+        return self.search_fields
+
+    def get_readonly_fields(self, request, obj=None):
+        if sharding_enabled() and obj is not None:
+            # A new owner may hash to another shard.
+            return self.readonly_fields + ("user",)
+        return self.readonly_fields
+
+    def get_object(self, request, object_id, from_field=None):
+        """
+        Looks the task up on the shard its id came from first, then on the
+        others in case it was rebalanced.
+        """
+        if not sharding_enabled() or from_field is not None:
+            return super().get_object(request, object_id, from_field)
+        try:
+            pk = int(object_id)
+        except (TypeError, ValueError):
+            return None
+        home = shard_for_task_id(pk)
+        queryset = self.get_queryset(request)
+        for alias in [home] + [a for a in settings.TASK_SHARDS if a != home]:
+            task = queryset.using(alias).filter(pk=pk).first()
+            if task is not None:
+                return task
+        return None
+
+    def save_model(self, request, obj, form, change):
+        if "attachment" in form.changed_data:
+            obj.attachment_name = obj.attachment.name if obj.attachment else ""
+        super().save_model(request, obj, form, change)
+
+    def delete_queryset(self, request, queryset):
+        """
+        The bulk delete action skips Task.delete(), so invalidate the
+        cached task responses of the affected users here.
+        """
+        user_ids = set(queryset.values_list("user_id", flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            invalidate_user_tasks(user_id)
+
+
+@admin.register(TaskDeletionJob)
+class TaskDeletionJobAdmin(admin.ModelAdmin):
+    """
+    Admin view for TaskDeletionJob model.
+    """
+
+    list_display = ("user", "status", "deleted", "total", "created_at", "updated_at")
+    list_filter = ("status",)
     readonly_fields = ("created_at", "updated_at")
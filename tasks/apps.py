@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_task_search_index(sender, using, **kwargs):
+    from .search import create_search_index
+
+    create_search_index(using)
+
+
+def reserve_task_id_range(sender, using, **kwargs):
+    from .sharding import reserve_id_range
+
+    reserve_id_range(using)
 
 
 class TasksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tasks"
+
+    def ready(self):
+        post_migrate.connect(create_task_search_index, sender=self)
+        post_migrate.connect(reserve_task_id_range, sender=self)
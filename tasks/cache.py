@@ -0,0 +1,119 @@
+"""
+Versioned response cache for task reads.
+
+Cached responses are keyed by user, request and a per-user generation
+counter. Any write to a user's tasks bumps the counter, which makes all of
+that user's cached responses unreachable at once; they then age out of the
+(size-bounded) cache backend on their own.
+"""
+
+import hashlib
+import random
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from userhub import metrics
+
+from .sharding import shard_for_user
+
+GENERATION_KEY = "tasks:generation:{}"
+RESPONSE_KEY = "tasks:response:{}:{}:{}"
+
+
+cache_lookups = metrics.counter(
+    "userhub_task_cache_lookups_total", "Task response cache lookups.", ["result"]
+)
+
+
+class CacheStats:
+    """
+    In-process hit/miss counters, also exported as cache_lookups.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        cache_lookups.inc(result="hit" if hit else "miss")
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[settings.TASK_CACHE_ALIAS]
+
+
+def get_generation(user_id):
+    cache = get_cache()
+    key = GENERATION_KEY.format(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from a random value so responses cached under a counter that
+        # was evicted can never be matched again.
+        cache.add(key, random.getrandbits(48), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(user_id):
+    try:
+        get_cache().incr(GENERATION_KEY.format(user_id))
+    except ValueError:
+        # No counter yet; get_generation() will start a fresh one.
+        pass
+
+
+def invalidate_user_tasks(user_id):
+    """
+    Invalidates a user's cached task responses.
+
+    The counter is bumped right away and again on commit, so a read racing
+    the write cannot cache pre-commit data under the new generation.
+    """
+    bump_generation(user_id)
+    # The user's tasks are written on their shard, not necessarily "default".
+    transaction.on_commit(
+        partial(bump_generation, user_id), using=shard_for_user(user_id)
+    )
+
+
+def response_cache_key(request, view_name, etag=None):
+    """
+    Returns the cache key of a response. ``etag`` is the state of the tasks
+    the response shows, so that a worker whose generation counter missed a
+    write (a process-local cache) never serves an old body under a new ETag.
+    """
+    # Serialized data contains absolute URLs, so the host is part of the key.
+    params = sorted(request.query_params.lists())
+    digest = hashlib.md5(
+        repr((request.build_absolute_uri(request.path), params, etag)).encode()
+    ).hexdigest()
+    return RESPONSE_KEY.format(
+        request.user.pk, get_generation(request.user.pk), f"{view_name}:{digest}"
+    )
+
+
+def get_cached_response_data(key):
+    data = get_cache().get(key)
+    stats.record(hit=data is not None)
+    return data
+
+
+def cache_response_data(key, data):
+    get_cache().set(key, data, settings.TASK_CACHE_TIMEOUT)
@@ -0,0 +1,145 @@
+"""
+Serving task attachments to their owners.
+
+Files are streamed with ``FileResponse`` and honour single byte-range
+requests, so interrupted downloads can be resumed. When
+ATTACHMENT_SENDFILE_BACKEND is set the response carries no body and the
+front proxy sends the file itself (``X-Sendfile`` for Apache/lighttpd,
+``X-Accel-Redirect`` for nginx), which then also takes care of ranges.
+"""
+
+import os
+import re
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.utils.text import get_valid_filename
+
+from userhub.conditional import make_etag, set_validators
+
+RANGE_RE = re.compile(r"^bytes=(?P<start>\d*)-(?P<end>\d*)$")
+
+
+class RangeFile:
+    """
+    File-like object exposing ``length`` bytes of ``f`` from ``start`` on.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.file = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Returns the inclusive ``(start, end)`` byte range a Range header asks for,
+    None when the whole file should be sent instead (no header, a malformed
+    one, or several ranges), or False when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match["start"], match["end"]
+    if not start:
+        if not end:
+            return None
+        # Suffix range: the last N bytes.
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def download_filename(task):
+    _, ext = os.path.splitext(task.attachment.name)
+    return f"{get_valid_filename(task.title) or 'attachment'}{ext.lower()}"
+
+
+def attachment_response(request, task):
+    """
+    Returns the response serving ``task.attachment`` for ``request``, or
+    None when the file is missing from storage.
+    """
+    storage = task.attachment.storage
+    name = task.attachment.name
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    etag = make_etag(name, stat.st_size, int(stat.st_mtime))
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is not None:
+        return set_validators(response, etag, last_modified)
+
+    filename = download_filename(task)
+    backend = settings.ATTACHMENT_SENDFILE_BACKEND
+    if backend:
+        response = HttpResponse()
+        del response["Content-Type"]  # Let the proxy pick it from the file.
+        if backend == "x-accel-redirect":
+            prefix = settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX.rstrip("/")
+            response["X-Accel-Redirect"] = quote(f"{prefix}/{name}")
+        else:
+            response["X-Sendfile"] = path
+        response["Content-Disposition"] = (
+            f"attachment; filename*=UTF-8''{quote(filename)}"
+        )
+        return set_validators(response, etag, last_modified)
+
+    size = stat.st_size
+    byte_range = parse_range(request.headers.get("Range"), size)
+    if_range = request.headers.get("If-Range")
+    if (
+        byte_range is not None
+        and if_range
+        and not (
+            if_range == etag or parse_http_date_safe(if_range) == int(stat.st_mtime)
+        )
+    ):
+        # The client's partial copy is stale, so send the whole file.
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    f = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(f, as_attachment=True, filename=filename)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            RangeFile(f, start, end - start + 1), as_attachment=True, filename=filename
+        )
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    response["Cache-Control"] = "private"
+    return set_validators(response, etag, last_modified)
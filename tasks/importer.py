@@ -0,0 +1,150 @@
+"""
+Bulk import of tasks from CSV or NDJSON files.
+
+Files are parsed a row at a time, so memory use does not grow with their
+size. Rows are validated by TaskSerializer and the valid ones written with
+one bulk_create() per batch of TASK_IMPORT_BATCH_SIZE rows, each batch in
+its own transaction, so the database write lock is released between
+batches. Invalid rows are skipped and reported with their line numbers.
+Both the import endpoint and the import_tasks command use this module.
+"""
+
+import codecs
+import csv
+import json
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from .cache import invalidate_user_tasks
+from .models import Task
+from .serializers import TaskSerializer
+from .sharding import shard_for_user
+
+IMPORT_FORMATS = ["ndjson", "csv"]
+# Serializer fields read from imported rows; other columns are ignored, so
+# files written by /api/tasks/export/ can be imported again.
+IMPORT_FIELDS = ["title", "description"]
+EXTENSION_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+def guess_format(filename):
+    """
+    Returns the import format for ``filename`` from its extension, or None.
+    """
+    return EXTENSION_FORMATS.get(os.path.splitext(filename or "")[1].lower())
+
+
+def row_error(message):
+    return {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+
+
+def read_ndjson(file):
+    """
+    Yields ``(line number, row)`` for each non-blank line of a binary file.
+    Lines that are not JSON are yielded as a ValidationError.
+    """
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, ValidationError(row_error(f"Invalid JSON: {exc}"))
+
+
+def decode_lines(file, undecodable):
+    """
+    Yields the lines of a binary UTF-8 file as text, one at a time, so a bad
+    byte only spoils its own line. Lines that cannot be decoded are appended
+    to ``undecodable`` as ``(line number, error)`` and yielded with the bad
+    bytes replaced, which keeps their quotes for the csv reader.
+    """
+    for number, line in enumerate(file, start=1):
+        if number == 1:
+            line = line.removeprefix(codecs.BOM_UTF8)
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            undecodable.append((number, exc))
+            yield line.decode("utf-8", "replace")
+
+
+def read_csv(file):
+    """
+    Yields ``(line number, row)`` for each record of a binary CSV file with
+    a header line. Records with a line that is not UTF-8 are yielded as a
+    ValidationError; a record the file cannot be read past, or an unreadable
+    header, ends the import with one.
+    """
+    undecodable = []
+    reader = csv.reader(decode_lines(file, undecodable))
+    header = None
+    try:
+        for values in reader:
+            if undecodable:
+                # The bad line was this record, or a line of it.
+                number, exc = undecodable[0]
+                undecodable.clear()
+                yield number, ValidationError(row_error(f"Invalid UTF-8: {exc}"))
+                if header is None:
+                    return
+                continue
+            if not values:
+                continue
+            if header is None:
+                header = values
+                continue
+            # The same rows as csv.DictReader.
+            row = dict(zip(header, values))
+            if len(values) > len(header):
+                row[None] = values[len(header) :]
+            row.update(dict.fromkeys(header[len(values) :]))
+            yield reader.line_num, row
+    except csv.Error as exc:
+        yield reader.line_num + 1, ValidationError(row_error(f"Unreadable CSV: {exc}"))
+
+
+READERS = {"ndjson": read_ndjson, "csv": read_csv}
+
+
+def import_tasks(user, file, import_format, batch_size=None, max_errors=None):
+    """
+    Creates tasks for ``user`` from the rows of a binary ``file``.
+
+    Returns a report with the number of tasks created, the number of rows
+    that failed and the first ``max_errors`` (TASK_IMPORT_MAX_ERRORS) of
+    their errors, as ``{"line": ..., "errors": ...}``.
+    """
+    batch_size = batch_size or settings.TASK_IMPORT_BATCH_SIZE
+    if max_errors is None:
+        max_errors = settings.TASK_IMPORT_MAX_ERRORS
+    serializer = TaskSerializer(fields=IMPORT_FIELDS)
+    alias = shard_for_user(user.pk)
+    report = {"created": 0, "failed": 0, "errors": []}
+
+    rows = READERS[import_format](file)
+    while batch := list(islice(rows, batch_size)):
+        tasks = []
+        for line, data in batch:
+            try:
+                if isinstance(data, ValidationError):
+                    raise data
+                attrs = serializer.run_validation(data)
+            except ValidationError as exc:
+                report["failed"] += 1
+                if len(report["errors"]) < max_errors:
+                    report["errors"].append({"line": line, "errors": exc.detail})
+            else:
+                # user_id skips the relation descriptor, a measurable cost per row.
+                tasks.append(Task(user_id=user.pk, **attrs))
+        if tasks:
+            with transaction.atomic(using=alias):
+                Task.objects.bulk_create(tasks)
+                invalidate_user_tasks(user.pk)
+            report["created"] += len(tasks)
+    return report
@@ -0,0 +1,108 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from userhub.routers import use_primary
+
+from .cache import invalidate_user_tasks
+from .models import Task, TaskDeletionJob, delete_attachment_files
+from .sharding import shard_for_user
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.TASK_JOBS_WORKERS, thread_name_prefix="task-jobs"
+        )
+    return _executor
+
+
+def submit(func, *args):
+    """
+    Runs ``func(*args)`` on the background job pool, or inline when
+    TASK_JOBS_ALWAYS_EAGER is set (tests, management commands).
+    """
+    if settings.TASK_JOBS_ALWAYS_EAGER:
+        return func(*args)
+    return get_executor().submit(_run_job, func, *args)
+
+
+def _run_job(func, *args):
+    close_old_connections()
+    try:
+        # Jobs act on what they read, so never on a lagging replica.
+        with use_primary():
+            return func(*args)
+    except Exception:
+        logger.exception("Background job %s failed", func.__name__)
+    finally:
+        connections.close_all()
+
+
+def run_deletion_job(job_id):
+    """
+    Deletes a user's tasks in ascending id ranges of TASK_DELETE_CHUNK_SIZE.
+
+    Every chunk is its own short transaction, so the database write lock is
+    released between batches and other requests can interleave. Attachment
+    files are unlinked once the chunk has been committed.
+    """
+    # Claimed atomically: a run still queued for a job that was given up as
+    # stale (see TaskDeletionJob.is_stale) finds it failed and does nothing.
+    claimed = TaskDeletionJob.objects.filter(
+        pk=job_id, status=TaskDeletionJob.PENDING
+    ).update(status=TaskDeletionJob.RUNNING, updated_at=timezone.now())
+    if not claimed:
+        return
+
+    try:
+        job = TaskDeletionJob.objects.get(pk=job_id)
+        shard = shard_for_user(job.user_id)
+        tasks = Task.objects.using(shard).filter(
+            user_id=job.user_id, id__lte=job.last_task_id
+        )
+        TaskDeletionJob.objects.filter(pk=job_id).update(
+            total=tasks.count(), updated_at=timezone.now()
+        )
+
+        position = 0
+        while True:
+            rows = list(
+                tasks.filter(id__gt=position)
+                .order_by("id")
+                .values_list("id", "attachment")[: settings.TASK_DELETE_CHUNK_SIZE]
+            )
+            if not rows:
+                break
+
+            first_id, last_id = rows[0][0], rows[-1][0]
+            # The job row stays on "default" when tasks are sharded.
+            with transaction.atomic(using=shard), transaction.atomic():
+                deleted, _ = tasks.filter(id__gte=first_id, id__lte=last_id).delete()
+                TaskDeletionJob.objects.filter(pk=job_id).update(
+                    deleted=F("deleted") + deleted, updated_at=timezone.now()
+                )
+                invalidate_user_tasks(job.user_id)
+            delete_attachment_files([name for _, name in rows if name])
+
+            position = last_id
+            time.sleep(settings.TASK_DELETE_CHUNK_PAUSE)
+
+        TaskDeletionJob.objects.filter(pk=job_id).update(
+            status=TaskDeletionJob.DONE, updated_at=timezone.now()
+        )
+    except Exception as exc:
+        TaskDeletionJob.objects.filter(pk=job_id).update(
+            status=TaskDeletionJob.FAILED, error=str(exc), updated_at=timezone.now()
+        )
+        raise
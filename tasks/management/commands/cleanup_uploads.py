@@ -0,0 +1,80 @@
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks.models import AttachmentUpload
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes resumable uploads that have not received a chunk for "
+        "ATTACHMENT_UPLOAD_MAX_AGE seconds, and part files without an upload."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be deleted without touching files or rows.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        expired = AttachmentUpload.objects.filter(
+            updated_at__lt=AttachmentUpload.expiry_cutoff()
+        )
+        deleted = 0
+        for upload in expired.iterator():
+            if not dry_run:
+                upload.delete()
+            deleted += 1
+        orphans = self.delete_orphans(dry_run)
+        prefix = "Would have " if dry_run else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix}deleted {deleted} expired uploads and {orphans} "
+                "orphaned part files."
+            )
+        )
+
+    def delete_orphans(self, dry_run):
+        """
+        Deletes old part files whose upload row is gone, e.g. with its user.
+        """
+        directory = settings.ATTACHMENT_UPLOAD_TEMP_DIR
+        try:
+            filenames = os.listdir(directory)
+        except FileNotFoundError:
+            return 0
+        cutoff = time.time() - settings.ATTACHMENT_UPLOAD_MAX_AGE
+        paths = {}
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            stem, extension = os.path.splitext(filename)
+            try:
+                pk = uuid.UUID(stem)
+            except ValueError:
+                # Not a part file.
+                continue
+            if extension == ".part" and os.path.getmtime(path) < cutoff:
+                paths[pk] = path
+
+        deleted = 0
+        names = list(paths)
+        for start in range(0, len(names), 500):
+            batch = names[start : start + 500]
+            existing = set(
+                AttachmentUpload.objects.filter(pk__in=batch).values_list(
+                    "pk", flat=True
+                )
+            )
+            for pk in batch:
+                if pk in existing:
+                    continue
+                if not dry_run:
+                    os.remove(paths[pk])
+                deleted += 1
+        return deleted
@@ -0,0 +1,127 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks.cache import invalidate_user_tasks
+from tasks.models import Task
+from tasks.storage import attachment_storage
+from tasks.thumbnails import delete_thumbnails
+
+ATTACHMENT_DIR = "task_attachments"
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves task attachments into content-addressed storage and deletes "
+        "blobs no task references any more."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change without touching files or rows.",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=3600,
+            help=(
+                "Only collect unreferenced blobs older than this many seconds, "
+                "so uploads still being attached are left alone (default 3600)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        migrated = self.migrate_files(dry_run)
+        collected, collected_bytes = self.collect_garbage(options["min_age"], dry_run)
+        prefix = "Would have " if dry_run else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix}migrated {migrated} attachments and collected "
+                f"{collected} unreferenced blobs ({collected_bytes} bytes)."
+            )
+        )
+
+    def migrate_files(self, dry_run):
+        """
+        Rewrites every attachment stored under its upload name to its blob.
+        """
+        migrated = 0
+        names = set()
+        for alias in settings.TASK_SHARDS:
+            names.update(
+                Task.objects.using(alias)
+                .exclude(attachment="")
+                .exclude(attachment=None)
+                .values_list("attachment", flat=True)
+            )
+        for name in sorted(names):
+            if attachment_storage.is_blob_name(name, ATTACHMENT_DIR):
+                continue
+            if not attachment_storage.exists(name):
+                self.stderr.write(f"Missing file for attachment {name}, skipped.")
+                continue
+
+            migrated += 1
+            if dry_run:
+                continue
+            with attachment_storage.open(name) as f:
+                blob = attachment_storage.save(name, f)
+            user_ids = set()
+            for alias in settings.TASK_SHARDS:
+                tasks = Task.objects.using(alias).filter(attachment=name)
+                user_ids.update(tasks.values_list("user_id", flat=True))
+                # The blob name drops the file name, so keep it for display.
+                tasks.filter(attachment_name="").update(
+                    attachment_name=os.path.basename(name)
+                )
+                tasks.update(attachment=blob)
+            for user_id in user_ids:
+                invalidate_user_tasks(user_id)
+            attachment_storage.delete(name)
+        return migrated
+
+    def collect_garbage(self, min_age, dry_run):
+        """
+        Deletes blobs that are not referenced by any task.
+        """
+        root = attachment_storage.path(ATTACHMENT_DIR)
+        cutoff = time.time() - min_age
+        collected = collected_bytes = 0
+
+        candidates = []
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, attachment_storage.location).replace(
+                    "\\", "/"
+                )
+                if attachment_storage.is_blob_name(name, ATTACHMENT_DIR):
+                    if os.path.getmtime(path) < cutoff:
+                        candidates.append(name)
+
+        for start in range(0, len(candidates), 500):
+            batch = candidates[start : start + 500]
+            referenced = set()
+            for alias in settings.TASK_SHARDS:
+                referenced.update(
+                    Task.objects.using(alias)
+                    .filter(attachment__in=batch)
+                    .values_list("attachment", flat=True)
+                )
+            for name in batch:
+                if name in referenced:
+                    continue
+                size = attachment_storage.size(name)
+                if not dry_run:
+                    if not attachment_storage.delete_if_idle(name, min_age):
+                        # Reused since the directory scan.
+                        continue
+                    delete_thumbnails(name)
+                collected += 1
+                collected_bytes += size
+        return collected, collected_bytes
@@ -0,0 +1,60 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.backends import users_with_email
+from tasks.importer import IMPORT_FORMATS, guess_format, import_tasks
+
+
+class Command(BaseCommand):
+    help = "Imports tasks for a user from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="Email address of the tasks' owner.")
+        parser.add_argument("path", help='File to import, or "-" for stdin.')
+        parser.add_argument(
+            "--format",
+            choices=IMPORT_FORMATS,
+            help="File format. Defaults to the one implied by the extension.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Rows per transaction. Defaults to TASK_IMPORT_BATCH_SIZE.",
+        )
+
+    def handle(self, *args, **options):
+        user = users_with_email(options["email"]).first()
+        if user is None:
+            raise CommandError(f"No user with email {options['email']}.")
+        path = options["path"]
+        import_format = options["format"] or guess_format(path)
+        if import_format is None:
+            raise CommandError("Pass --format: the file extension is not known.")
+
+        started = time.monotonic()
+        if path == "-":
+            report = import_tasks(
+                user, sys.stdin.buffer, import_format, options["batch_size"]
+            )
+        else:
+            try:
+                with open(path, "rb") as file:
+                    report = import_tasks(
+                        user, file, import_format, options["batch_size"]
+                    )
+            except OSError as exc:
+                raise CommandError(exc)
+        elapsed = time.monotonic() - started
+
+        for error in report["errors"]:
+            self.stderr.write(f"Line {error['line']}: {json.dumps(error['errors'])}")
+        rows = report["created"] + report["failed"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report['created']} tasks, {report['failed']} rows "
+                f"failed ({rows / max(elapsed, 1e-6):.0f} rows/s)."
+            )
+        )
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from tasks.cache import invalidate_user_tasks
+from tasks.models import Task
+from tasks.sharding import get_id_sequence, set_id_sequence, shard_for_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves tasks to the shard their user hashes to. Run it after changing "
+        "TASK_SHARD_DATABASES; it can be interrupted and run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Tasks copied and deleted per transaction (default 500).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report how many tasks would move without moving them.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        moved = users = 0
+        for source in settings.TASK_SHARDS:
+            user_ids = (
+                Task.objects.using(source)
+                .order_by()
+                .values_list("user_id", flat=True)
+                .distinct()
+            )
+            for user_id in list(user_ids):
+                target = shard_for_user(user_id)
+                if target == source:
+                    continue
+                users += 1
+                tasks = Task.objects.using(source).filter(user_id=user_id)
+                if options["dry_run"]:
+                    moved += tasks.count()
+                    continue
+                moved += self.move_tasks(tasks, target, options["batch_size"])
+                invalidate_user_tasks(user_id)
+                self.stdout.write(f"User {user_id}: {source} -> {target}")
+
+        prefix = "Would have moved" if options["dry_run"] else "Moved"
+        self.stdout.write(
+            self.style.SUCCESS(f"{prefix} {moved} tasks of {users} users.")
+        )
+
+    def move_tasks(self, tasks, target, batch_size):
+        """
+        Copies the tasks to ``target`` batch by batch, deleting each batch from
+        the source once it is committed on the target.
+        """
+        connection = connections[target]
+        fields = Task._meta.concrete_fields
+        # Raw inserts: bulk_create() would reset the auto_now(_add) timestamps.
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            connection.ops.quote_name(Task._meta.db_table),
+            ", ".join(connection.ops.quote_name(field.column) for field in fields),
+            ", ".join(["%s"] * len(fields)),
+        )
+        moved = 0
+        while True:
+            batch = list(tasks.order_by("id")[:batch_size])
+            if not batch:
+                return moved
+            ids = [task.pk for task in batch]
+            present = set(
+                Task.objects.using(target)
+                .filter(pk__in=ids)
+                .values_list("pk", flat=True)
+            )
+            rows = [
+                [
+                    field.get_db_prep_save(getattr(task, field.attname), connection)
+                    for field in fields
+                ]
+                for task in batch
+                if task.pk not in present
+            ]
+
+            with transaction.atomic(using=target):
+                sqlite = connection.vendor == "sqlite"
+                sequence = get_id_sequence(target) if sqlite else None
+                if rows:
+                    with connection.cursor() as cursor:
+                        cursor.executemany(sql, rows)
+                if sqlite:
+                    # Keep allocating from the target's own id range.
+                    set_id_sequence(target, sequence)
+            with transaction.atomic(using=tasks.db):
+                Task.objects.using(tasks.db).filter(pk__in=ids).delete()
+            moved += len(batch)
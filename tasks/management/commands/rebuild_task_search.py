@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from tasks.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index for tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to rebuild the index on. Defaults to "default".',
+        )
+
+    def handle(self, *args, **options):
+        if not rebuild_search_index(options["database"]):
+            raise CommandError(
+                "Full-text search is only available on SQLite databases."
+            )
+        self.stdout.write(self.style.SUCCESS("Task search index rebuilt."))
@@ -0,0 +1,54 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the primary SQLite database into the read replicas with the "
+        "SQLite online backup API. Run it periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            action="append",
+            dest="databases",
+            help="Replica alias to refresh. Defaults to all DATABASE_READ_REPLICAS.",
+        )
+
+    def handle(self, *args, **options):
+        aliases = options["databases"] or settings.DATABASE_READ_REPLICAS
+        if not aliases:
+            raise CommandError("No read replicas are configured (DATABASE_REPLICAS).")
+
+        source = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            if alias not in settings.DATABASE_READ_REPLICAS:
+                raise CommandError(f"{alias} is not a read replica.")
+            if source.vendor != "sqlite" or connections[alias].vendor != "sqlite":
+                raise CommandError(
+                    "sync_replica only copies SQLite databases; use the database "
+                    "server's own replication otherwise."
+                )
+
+        source.ensure_connection()
+        for alias in aliases:
+            started = time.monotonic()
+            # Copied in place rather than swapped in, so replica connections
+            # kept open by CONN_MAX_AGE see the new contents.
+            target = sqlite3.connect(
+                connections[alias].settings_dict["NAME"], timeout=20
+            )
+            try:
+                source.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Synced {alias} in {time.monotonic() - started:.2f}s."
+                )
+            )
@@ -1,21 +1,241 @@
 import os
+import uuid
+from collections import defaultdict
+from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_user_tasks
+from .sharding import shard_for_user, sharding_enabled
+from .storage import attachment_storage
+from .thumbnails import (
+    blob_digest,
+    delete_thumbnails,
+    generate_thumbnail,
+    is_image_name,
+    thumbnail_name,
+)
+
+
+class TaskQuerySet(models.QuerySet):
+    """
+    Writes new tasks to their user's shard (see tasks.sharding). Querysets
+    without a user or task hint cannot be routed, so the bulk methods group
+    their objects by shard themselves.
+    """
+
+    def by_shard(self, objs):
+        groups = defaultdict(list)
+        for obj in objs:
+            groups[shard_for_user(obj.user_id)].append(obj)
+        return groups.items()
+
+    def create(self, **kwargs):
+        if self._db is not None or not sharding_enabled():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=shard_for_user(obj.user_id))
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if self._db is not None or not sharding_enabled():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        for alias, group in self.by_shard(objs):
+            super(TaskQuerySet, self.using(alias)).bulk_create(group, *args, **kwargs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if self._db is not None or not sharding_enabled():
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        return sum(
+            super(TaskQuerySet, self.using(alias)).bulk_update(
+                group, fields, *args, **kwargs
+            )
+            for alias, group in self.by_shard(objs)
+        )
 
 
 class Task(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tasks")
+    # No database constraint: with sharding, tasks and users live in
+    # different databases. The cascade is kept by delete_sharded_tasks().
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="tasks", db_constraint=False
+    )
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
-    attachment = models.FileField(upload_to="task_attachments/", blank=True, null=True)
+    # Content-addressed: identical files are stored once and shared.
+    attachment = models.FileField(
+        upload_to="task_attachments/",
+        storage=attachment_storage,
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+    # The uploaded file's name, which content addressing does not keep.
+    attachment_name = models.CharField(max_length=255, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TaskQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
+    class Meta:
+        indexes = [
+            # Serves the per-user "newest first" listing and keyset pagination.
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="task_user_created_idx"
+            ),
+        ]
+
+    def delete(self, *args, **kwargs):
+        attachment = self.attachment.name
+        super().delete(*args, **kwargs)
+        delete_attachment_files([attachment])
+        invalidate_user_tasks(self.user_id)
+
+
+class TaskDeletionJob(models.Model):
+    """
+    Tracks a background "delete all tasks" run for a user.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="task_deletion_jobs"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Tasks with a higher id were created after the request and are kept.
+    last_task_id = models.BigIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.status}"
+
+    def is_stale(self):
+        """
+        True for an unfinished job without progress for TASK_JOB_STALE_SECONDS,
+        whose worker is gone (e.g. the process was restarted).
+        """
+        cutoff = timezone.now() - timedelta(seconds=settings.TASK_JOB_STALE_SECONDS)
+        return self.status in (self.PENDING, self.RUNNING) and self.updated_at < cutoff
+
+
+class AttachmentUpload(models.Model):
+    """
+    A resumable, chunked attachment upload in progress.
+
+    Chunks are appended to a part file under ATTACHMENT_UPLOAD_TEMP_DIR;
+    ``offset`` is the number of bytes received so far.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="attachment_uploads"
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def path(self):
+        return os.path.join(settings.ATTACHMENT_UPLOAD_TEMP_DIR, f"{self.pk}.part")
+
+    @staticmethod
+    def expiry_cutoff():
+        """
+        Uploads not written to since this time have expired: clients gave up
+        on them, and the cleanup_uploads command deletes them.
+        """
+        return timezone.now() - timedelta(seconds=settings.ATTACHMENT_UPLOAD_MAX_AGE)
+
     def delete(self, *args, **kwargs):
-        if self.attachment and os.path.isfile(self.attachment.path):
-            os.remove(self.attachment.path)
+        if os.path.isfile(self.path):
+            os.remove(self.path)
         super().delete(*args, **kwargs)
+
+
+def delete_attachment_files(names):
+    """
+    Removes attachment blobs that no task references any more. Call it after
+    the referencing rows are gone; shared blobs are left in place, and so are
+    blobs saved in the last ATTACHMENT_BLOB_MIN_AGE seconds, which a task
+    still being saved may use. dedupe_attachments collects those later.
+    """
+    names = {name for name in names if name}
+    if not names:
+        return
+    referenced = set()
+    for alias in settings.TASK_SHARDS:
+        referenced.update(
+            Task.objects.using(alias)
+            .filter(attachment__in=names)
+            .values_list("attachment", flat=True)
+        )
+    for name in names - referenced:
+        if attachment_storage.delete_if_idle(name, settings.ATTACHMENT_BLOB_MIN_AGE):
+            delete_thumbnails(name)
+
+
+# Signal to invalidate cached task responses on every save (API, admin).
+# Deletes invalidate in Task.delete() and the bulk delete paths instead: a
+# post_delete receiver would stop queryset deletes from being fast deletes.
+@receiver(post_save, sender=Task)
+def invalidate_cached_tasks(sender, instance, **kwargs):
+    invalidate_user_tasks(instance.user_id)
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_tasks(sender, instance, using, **kwargs):
+    """
+    The cascade from a deleted user only reaches tasks in the user's own
+    database, so tasks on another shard are deleted here.
+    """
+    shard = shard_for_user(instance.pk)
+    if shard == using:
+        return
+    tasks = Task.objects.using(shard).filter(user_id=instance.pk)
+    attachments = list(tasks.values_list("attachment", flat=True))
+    tasks.delete()
+    delete_attachment_files(attachments)
+    invalidate_user_tasks(instance.pk)
+
+
+@receiver(post_save, sender=Task)
+def queue_thumbnail(sender, instance, **kwargs):
+    name = instance.attachment.name
+    if not is_image_name(name):
+        return
+    digest = blob_digest(name)
+    if digest and attachment_storage.exists(thumbnail_name(digest)):
+        return
+    from .jobs import submit  # tasks.jobs imports this module.
+
+    transaction.on_commit(lambda: submit(generate_thumbnail, name))
@@ -0,0 +1,133 @@
+from django.db import connections, router
+from rest_framework.filters import SearchFilter
+
+FTS_TABLE = "tasks_task_fts"
+
+# External-content FTS5 index over tasks_task. The triggers keep it in step
+# with every write path, including bulk_create(), update() and queryset
+# delete(), which never reach Task.save()/Task.delete().
+FTS_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title,
+        description,
+        content='tasks_task',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tasks_task BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tasks_task BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF title, description ON tasks_task BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+_available = {}
+
+
+def search_index_available(using="default"):
+    """
+    Returns True if the full-text index exists on the given database.
+    """
+    if using not in _available:
+        connection = connections[using]
+        if connection.vendor != "sqlite":
+            _available[using] = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                    [FTS_TABLE],
+                )
+                _available[using] = cursor.fetchone() is not None
+    return _available[using]
+
+
+def create_search_index(using="default"):
+    """
+    Creates the FTS5 table and its sync triggers. Returns False on databases
+    that do not support it, in which case search falls back to LIKE scans.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite" or not router.allow_migrate(
+        using, "tasks", model_name="task"
+    ):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE],
+        )
+        exists = cursor.fetchone() is not None
+        for statement in FTS_SCHEMA:
+            cursor.execute(statement)
+        if not exists:
+            # Index rows that predate the table.
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _available[using] = True
+    return True
+
+
+def rebuild_search_index(using="default"):
+    """
+    Recreates the index contents from tasks_task.
+    """
+    if not create_search_index(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return True
+
+
+def build_match_query(terms):
+    """
+    Turns search terms into an FTS5 query: every term must match, and the
+    last token of each term is matched as a prefix for search-as-you-type.
+    """
+    phrases = []
+    for term in terms:
+        if not any(char.isalnum() for char in term):
+            continue
+        phrases.append('"{}"*'.format(term.replace('"', '""')))
+    return " ".join(phrases)
+
+
+class TaskSearchFilter(SearchFilter):
+    """
+    Ranked full-text search over title and description.
+
+    Uses the FTS5 index where it exists and falls back to DRF's
+    ``icontains`` search otherwise.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        match = build_match_query(self.get_search_terms(request))
+        if not match or not search_index_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = tasks_task.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+            select={"search_rank": f"{FTS_TABLE}.rank"},
+            order_by=["search_rank"],
+        )
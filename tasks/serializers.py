@@ -1,11 +1,60 @@
+import os
+import re
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+
+from userhub.profiling import timed
+
+from .models import AttachmentUpload, Task, TaskDeletionJob
+from .thumbnails import blob_digest, is_image_name
+
+# Upper bound on the number of items accepted by the bulk endpoints.
+MAX_BULK_ITEMS = 500
+
 
-from .models import Task
+class TaskListSerializer(serializers.ListSerializer):
+    """
+    List form of TaskSerializer that writes with bulk queries.
+    """
+
+    @timed("serialize")
+    def to_representation(self, data):
+        return super().to_representation(data)
+
+    def create(self, validated_data):
+        tasks = [Task(**attrs) for attrs in validated_data]
+        return Task.objects.bulk_create(tasks)
+
+    def update(self, instance, validated_data):
+        # bulk_update() skips auto_now, so updated_at is set by hand.
+        now = timezone.now()
+        fields = {"updated_at"}
+        for task, attrs in zip(instance, validated_data):
+            for attr, value in attrs.items():
+                setattr(task, attr, value)
+                fields.add(attr)
+            task.updated_at = now
+        Task.objects.bulk_update(instance, sorted(fields))
+        return instance
 
 
 class TaskSerializer(serializers.ModelSerializer):
+    """
+    Pass ``fields`` to only include some of the fields (sparse fieldsets).
+    """
+
+    download_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+
+    # Model fields read by fields that are not model fields themselves.
+    field_sources = {"download_url": ["attachment"], "thumbnail_url": ["attachment"]}
+
     class Meta:
         model = Task
+        list_serializer_class = TaskListSerializer
         # The 'user' field is not included here because it will be set
         # automatically from the request context in the view.
         fields = [
@@ -13,7 +62,109 @@ class TaskSerializer(serializers.ModelSerializer):
             "title",
             "description",
             "attachment",
+            "attachment_name",
+            "download_url",
+            "thumbnail_url",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["id", "created_at", "updated_at"]
+        read_only_fields = ["id", "attachment_name", "created_at", "updated_at"]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def model_fields_for(cls, fields):
+        """
+        Returns the model fields needed to serialize ``fields``.
+        """
+        names = set()
+        for name in fields:
+            names.update(cls.field_sources.get(name, [name]))
+        return names
+
+    def validate(self, attrs):
+        if "attachment" in attrs:
+            attachment = attrs["attachment"]
+            attrs["attachment_name"] = attachment.name if attachment else ""
+        return attrs
+
+    @timed("serialize")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+    def get_download_url(self, obj):
+        # Checks the owner, unlike the attachment's media URL.
+        if not obj.attachment.name:
+            return None
+        return reverse(
+            "task-download", args=[obj.pk], request=self.context.get("request")
+        )
+
+    def get_thumbnail_url(self, obj):
+        name = obj.attachment.name
+        if not is_image_name(name):
+            return None
+        url = reverse(
+            "task-thumbnail", args=[obj.pk], request=self.context.get("request")
+        )
+        # Versioned by content, so clients can cache it for a long time.
+        digest = blob_digest(name)
+        return f"{url}?v={digest[:16]}" if digest else url
+
+
+class TaskIdListSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_ITEMS,
+    )
+
+
+class TaskDeletionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TaskDeletionJob
+        fields = [
+            "id",
+            "status",
+            "total",
+            "deleted",
+            "error",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
+class AttachmentUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AttachmentUpload
+        fields = ["id", "filename", "size", "offset", "sha256", "created_at"]
+        read_only_fields = ["id", "offset", "created_at"]
+
+    def validate_filename(self, value):
+        value = os.path.basename(value.replace("\\", "/"))
+        if not value:
+            raise serializers.ValidationError("A file name is required.")
+        return value
+
+    def validate_size(self, value):
+        if value > settings.ATTACHMENT_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Files may be at most {settings.ATTACHMENT_UPLOAD_MAX_SIZE} bytes."
+            )
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and not re.fullmatch(r"[0-9a-f]{64}", value):
+            raise serializers.ValidationError("Expected a hex SHA-256 digest.")
+        return value
+
+
+class AttachmentUploadFinalizeSerializer(serializers.Serializer):
+    task = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r"^[0-9a-fA-F]{64}$", required=False)
@@ -0,0 +1,110 @@
+"""
+Per-user sharding of the Task table.
+
+Tasks live on one of the TASK_SHARDS database aliases ("default" is shard
+0), picked by a hash of their user id, so all of a user's tasks share a
+shard and every user-scoped query touches exactly one database. With a
+single shard (the default) everything stays on "default".
+
+Each shard hands out task ids from its own range of TASK_SHARD_ID_SPAN
+ids, so ids stay unique across shards: /api/tasks/<id>/, cursors and bulk
+id lists mean the same thing wherever a task lives.
+"""
+
+import zlib
+
+from django.conf import settings
+from django.db import connections
+
+TASK_SHARD_ID_SPAN = 2**40
+TASK_TABLE = "tasks_task"
+
+
+def sharding_enabled():
+    return len(settings.TASK_SHARDS) > 1
+
+
+def shard_for_user(user_id):
+    shards = settings.TASK_SHARDS
+    if len(shards) == 1:
+        return shards[0]
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def shard_for_task_id(task_id):
+    """
+    Returns the shard that allocated ``task_id``. Rebalanced tasks may since
+    have moved to another shard.
+    """
+    index = int(task_id) // TASK_SHARD_ID_SPAN
+    shards = settings.TASK_SHARDS
+    return shards[index] if 0 <= index < len(shards) else shards[0]
+
+
+def is_task_model(model):
+    return model._meta.label == "tasks.Task"
+
+
+class TaskShardRouter:
+    """
+    Routes Task queries to the shard of the user they belong to.
+
+    Querysets only carry that information when they come from a user
+    (``user.tasks``) or a task instance; code holding neither must pick the
+    shard with ``Task.objects.using(shard_for_user(user_id))``.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_task_model(model) or not sharding_enabled():
+            return None
+        instance = hints.get("instance")
+        if instance is None:
+            return None
+        if is_task_model(type(instance)):
+            return shard_for_user(instance.user_id)
+        return shard_for_user(instance.pk)
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Tasks point at users on "default" from any shard.
+        if sharding_enabled() and (
+            is_task_model(type(obj1)) or is_task_model(type(obj2))
+        ):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.TASK_SHARDS[0] or db not in settings.TASK_SHARDS:
+            return None
+        # Other shards only hold the task table.
+        return app_label == "tasks" and model_name == "task"
+
+
+def get_id_sequence(using):
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [TASK_TABLE])
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def set_id_sequence(using, value):
+    with connections[using].cursor() as cursor:
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = %s", [TASK_TABLE])
+        cursor.execute(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)",
+            [TASK_TABLE, value],
+        )
+
+
+def reserve_id_range(using):
+    """
+    Moves a shard's task id sequence into the shard's own id range. Returns
+    False on databases other than SQLite, whose sequences are left alone.
+    """
+    if using not in settings.TASK_SHARDS or connections[using].vendor != "sqlite":
+        return False
+    floor = settings.TASK_SHARDS.index(using) * TASK_SHARD_ID_SPAN
+    if get_id_sequence(using) < floor:
+        set_id_sequence(using, floor)
+    return True
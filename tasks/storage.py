@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+import uuid
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+BLOB_NAME_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w{1,10})?$")
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that keeps one copy of each distinct file.
+
+    Files are named after the SHA-256 of their content, e.g.
+    ``task_attachments/ab/cd/abcd...ef.pdf``, so uploading content that is
+    already stored writes nothing. A blob is shared by every task that
+    references it; see ``tasks.models.delete_attachment_files``.
+
+    Saving content that is already stored touches the blob instead, and
+    ``delete_if_idle()`` leaves recently touched blobs alone: a task being
+    saved with a reused blob is not committed yet, so the blob looks
+    unreferenced to whoever deletes the last committed task using it.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content, so an existing file is the same blob.
+        return name
+
+    def blob_name(self, digest, name):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        if not re.fullmatch(r"\.\w{1,10}", extension):
+            extension = ""
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        ).replace("\\", "/")
+
+    def is_blob_name(self, name, directory):
+        return bool(BLOB_NAME_RE.match(os.path.relpath(name, directory)))
+
+    def content_hash(self, content):
+        # Set by the upload handlers in tasks.uploadhandlers while streaming.
+        digest = getattr(content, "content_hash", None)
+        if digest:
+            return digest
+        hasher = hashlib.sha256()
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def _save(self, name, content):
+        name = self.blob_name(self.content_hash(content), name)
+        if self.touch(name):
+            return name
+
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file and rename it into place, so concurrent
+        # uploads of the same content never see a partial blob.
+        if hasattr(content, "temporary_file_path"):
+            file_move_safe(
+                content.temporary_file_path(), full_path, allow_overwrite=True
+            )
+        else:
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in content.chunks():
+                        f.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+                os.replace(temp_path, full_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        # A moved file keeps its mtime, which may be long before it is used.
+        os.utime(full_path)
+        return name
+
+    def touch(self, name):
+        """
+        Marks the blob ``name`` as just used. Returns False if there is none.
+        """
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete_if_idle(self, name, min_age):
+        """
+        Deletes the blob ``name`` unless it was saved or reused in the last
+        ``min_age`` seconds. Returns False if the blob was kept.
+        """
+        path = self.path(name)
+        # Moving the blob aside first means a concurrent touch() either
+        # happened before, and shows in the mtime checked below, or finds no
+        # blob and writes it again.
+        doomed = os.path.join(os.path.dirname(path), f".delete-{uuid.uuid4().hex}")
+        try:
+            os.rename(path, doomed)
+        except FileNotFoundError:
+            return True
+        if os.stat(doomed).st_mtime > time.time() - min_age:
+            # Same content as any blob written there meanwhile.
+            os.replace(doomed, path)
+            return False
+        os.remove(doomed)
+        return True
+
+
+class LocalFile(File):
+    """
+    A file on local disk that storage may move into place instead of copying,
+    like Django's TemporaryUploadedFile.
+    """
+
+    def __init__(self, path, name=None, content_hash=None):
+        super().__init__(open(path, "rb"), name or os.path.basename(path))
+        self.path = path
+        self.content_hash = content_hash
+
+    def temporary_file_path(self):
+        return self.path
+
+
+attachment_storage = ContentAddressedStorage()
@@ -1,16 +1,61 @@
+import csv
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+import warnings
 from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import (
+    AsyncClient,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-from .models import Task
+from userhub.renderers import FastJSONRenderer
+
+from .cache import get_generation
+from .jobs import run_deletion_job
+from .models import AttachmentUpload, Task, TaskDeletionJob
+from .search import search_index_available
+from .sharding import (
+    TASK_SHARD_ID_SPAN,
+    TaskShardRouter,
+    get_id_sequence,
+    reserve_id_range,
+    set_id_sequence,
+    shard_for_task_id,
+    shard_for_user,
+)
+from .storage import attachment_storage
+from .thumbnails import thumbnail_name
 
 
 class TaskAPITests(TestCase):
     def setUp(self):
+        caches[settings.TASK_CACHE_ALIAS].clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             username="testuser", email="test@example.com", password="testpass123"
@@ -55,7 +100,9 @@ class TaskAPITests(TestCase):
 
     def test_update_task(self):
         data = {"title": "Updated Task 1", "description": "Updated Description 1"}
-        response = self.client.patch(f"/api/tasks/{self.task1.id}/", data, format="json")
+        response = self.client.patch(
+            f"/api/tasks/{self.task1.id}/", data, format="json"
+        )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.task1.refresh_from_db()
         self.assertEqual(self.task1.title, "Updated Task 1")
@@ -65,11 +112,68 @@ class TaskAPITests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Task.objects.filter(user=self.user).count(), 1)
 
-
+    @override_settings(TASK_JOBS_ALWAYS_EAGER=True, TASK_DELETE_CHUNK_PAUSE=0)
     def test_delete_all_tasks(self):
-        response = self.client.delete("/api/tasks/delete-all/")
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete("/api/tasks/delete-all/")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         self.assertEqual(Task.objects.filter(user=self.user).count(), 0)
+        self.assertTrue(Task.objects.filter(user=self.other_user).exists())
+
+        response = self.client.get(response.data["status_url"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "done")
+        self.assertEqual(response.data["total"], 2)
+        self.assertEqual(response.data["deleted"], 2)
+
+    @override_settings(
+        TASK_JOBS_ALWAYS_EAGER=True, TASK_DELETE_CHUNK_SIZE=2, TASK_DELETE_CHUNK_PAUSE=0
+    )
+    def test_delete_all_tasks_in_chunks_keeps_newer_tasks(self):
+        for i in range(3):
+            Task.objects.create(user=self.user, title=f"Chunked {i}")
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete("/api/tasks/delete-all/")
+        newer = Task.objects.create(user=self.user, title="Created meanwhile")
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(list(Task.objects.filter(user=self.user)), [newer])
+        job = TaskDeletionJob.objects.get(pk=response.data["id"])
+        self.assertEqual((job.status, job.deleted), (TaskDeletionJob.DONE, 5))
+
+    @override_settings(TASK_JOBS_ALWAYS_EAGER=True, TASK_DELETE_CHUNK_PAUSE=0)
+    def test_delete_all_restarts_stale_job(self):
+        stale = TaskDeletionJob.objects.create(
+            user=self.user, status=TaskDeletionJob.RUNNING
+        )
+        TaskDeletionJob.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete("/api/tasks/delete-all/")
+        self.assertNotEqual(response.data["id"], stale.pk)
+        self.assertFalse(Task.objects.filter(user=self.user).exists())
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, TaskDeletionJob.FAILED)
+
+        # A run of the stale job still queued somewhere does nothing.
+        run_deletion_job(stale.pk)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, TaskDeletionJob.FAILED)
+
+    def test_deletion_job_fails_on_any_error(self):
+        job = TaskDeletionJob.objects.create(user=self.user)
+        with mock.patch("tasks.jobs.shard_for_user", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                run_deletion_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (TaskDeletionJob.FAILED, "boom"))
+
+    def test_delete_all_status_of_other_user_not_found(self):
+        job = TaskDeletionJob.objects.create(user=self.other_user)
+        response = self.client.get(f"/api/tasks/delete-all/{job.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_search_tasks(self):
         response = self.client.get("/api/tasks/?search=Task 1")
@@ -85,3 +189,921 @@ class TaskAPITests(TestCase):
         self.assertIn("count", response.data)
         self.assertIn("results", response.data)
         self.assertEqual(response.data["count"], 2)
+
+    def test_cursor_pagination(self):
+        for i in range(12):
+            Task.objects.create(user=self.user, title=f"Bulk Task {i}")
+
+        response = self.client.get("/api/tasks/?pagination=cursor")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertIsNone(response.data["previous"])
+        first_page = [task["id"] for task in response.data["results"]]
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 4)
+        self.assertIsNone(response.data["next"])
+        second_page = [task["id"] for task in response.data["results"]]
+        self.assertFalse(set(first_page) & set(second_page))
+        self.assertNotIn(self.other_task.id, first_page + second_page)
+
+        response = self.client.get(response.data["previous"])
+        self.assertEqual([task["id"] for task in response.data["results"]], first_page)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/tasks/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_sparse_fieldsets(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/tasks/?fields=id,title&pagination=cursor")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [set(task) for task in response.data["results"]], [{"id", "title"}] * 2
+        )
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"description"', queries[-1]["sql"])
+        self.assertNotIn('"attachment"', queries[-1]["sql"])
+
+        response = self.client.get(
+            f"/api/tasks/{self.task1.id}/?exclude=description,attachment"
+        )
+        self.assertEqual(
+            set(response.data),
+            {
+                "id",
+                "title",
+                "attachment_name",
+                "download_url",
+                "thumbnail_url",
+                "created_at",
+                "updated_at",
+            },
+        )
+
+        response = self.client.get("/api/tasks/?fields=title,owner")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["fields"], ["Unknown fields: owner."])
+
+    def test_fast_list_path_matches_serializer_output(self):
+        blob = "task_attachments/ab/cd/" + "abcd" * 16
+        Task.objects.create(user=self.user, title="Photo", attachment=blob + ".png")
+        Task.objects.create(
+            user=self.user,
+            title='Ünïcode \u2028\u2029 "quoted" </script>',
+            description="",
+            attachment="task_attachments/old name.pdf",
+        )
+        urls = [
+            "/api/tasks/",
+            "/api/tasks/?pagination=cursor&page_size=2",
+            "/api/tasks/?search=photo",
+            "/api/tasks/?ordering=title&fields=title,thumbnail_url",
+            "/api/tasks/?exclude=description,id",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                caches[settings.TASK_CACHE_ALIAS].clear()
+                with override_settings(TASK_LIST_FAST_PATH=False):
+                    expected = self.client.get(url, HTTP_ACCEPT="application/json")
+                caches[settings.TASK_CACHE_ALIAS].clear()
+                response = self.client.get(url, HTTP_ACCEPT="application/json")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.content, expected.content)
+
+    def test_fast_json_renderer_matches_json_renderer(self):
+        data = {
+            "text": "line\u2028separator é \U0001f600",
+            "when": timezone.now(),
+            "day": timezone.now().date(),
+            "amount": Decimal("1.50"),
+            "nested": [None, True, 1.25, {"id": 2**40}],
+        }
+        # The last two are not supported by orjson.
+        for value in (data, [data], {1: "non-string key"}, {"id": 2**70}):
+            self.assertEqual(
+                FastJSONRenderer().render(value), JSONRenderer().render(value)
+            )
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+    @override_settings(TASK_EXPORT_CHUNK_SIZE=1)
+    def test_export_streams_ndjson(self):
+        listed = self.client.get(
+            "/api/tasks/?ordering=title", HTTP_ACCEPT="application/json"
+        )
+        response = self.client.get("/api/tasks/export/?ordering=title")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertIn("attachment;", response["Content-Disposition"])
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], listed.data["results"])
+
+    def test_export_csv(self):
+        response = self.client.get(
+            "/api/tasks/export/?as=csv&fields=id,title&ordering=title",
+            HTTP_ACCEPT="text/csv",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            list(csv.reader(StringIO(content))),
+            [
+                ["id", "title"],
+                [str(self.task1.id), "Test Task 1"],
+                [str(self.task2.id), "Test Task 2"],
+            ],
+        )
+
+    def test_export_csv_escapes_formulas(self):
+        self.task1.title = '=HYPERLINK("http://example.com")'
+        self.task1.description = "-2+3"
+        self.task1.save()
+        self.task2.description = "Plain -text"
+        self.task2.save()
+        response = self.client.get(
+            "/api/tasks/export/?as=csv&fields=title,description&ordering=created_at"
+        )
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            list(csv.reader(StringIO(content)))[1:],
+            [
+                ['\'=HYPERLINK("http://example.com")', "'-2+3"],
+                ["Test Task 2", "Plain -text"],
+            ],
+        )
+
+    def test_export_gzip(self):
+        response = self.client.get(
+            "/api/tasks/export/?search=task&fields=title",
+            HTTP_ACCEPT_ENCODING="gzip, deflate",
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        lines = gzip.decompress(b"".join(response.streaming_content)).splitlines()
+        self.assertCountEqual(
+            [json.loads(line) for line in lines],
+            [{"title": "Test Task 1"}, {"title": "Test Task 2"}],
+        )
+
+    @override_settings(TASK_EXPORT_CHUNK_SIZE=1)
+    def test_export_streams_asynchronously_under_asgi(self):
+        token = AccessToken.for_user(self.user)
+
+        async def export():
+            response = await AsyncClient().get(
+                "/api/tasks/export/?fields=title&ordering=title",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            self.assertTrue(response.is_async)
+            return b"".join([block async for block in response.streaming_content])
+
+        with warnings.catch_warnings():
+            # Django's warning when it has to buffer a synchronous iterator.
+            warnings.filterwarnings("error", "StreamingHttpResponse must consume")
+            content = async_to_sync(export)()
+        self.assertEqual(
+            [json.loads(line) for line in content.splitlines()],
+            [{"title": "Test Task 1"}, {"title": "Test Task 2"}],
+        )
+
+    def test_export_unknown_format(self):
+        response = self.client.get("/api/tasks/export/?as=xml")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("as", response.data)
+
+    @override_settings(TASK_IMPORT_BATCH_SIZE=2)
+    def test_import_csv_reports_invalid_rows(self):
+        content = (
+            "\ufefftitle,description,ignored\n"
+            'Imported 1,"multi\nline \u2028 text",x\n'
+            ",missing title,x\n"
+            "Imported 2,,x\n"
+            f"{'x' * 201},too long,x\n"
+        ).encode()
+        response = self.client.post(
+            "/api/tasks/import/",
+            {"file": SimpleUploadedFile("tasks.csv", content)},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["failed"], 2)
+        self.assertEqual(
+            [
+                (error["line"], list(error["errors"]))
+                for error in response.data["errors"]
+            ],
+            [(4, ["title"]), (6, ["title"])],
+        )
+        imported = self.user.tasks.filter(title__startswith="Imported")
+        self.assertEqual(
+            dict(imported.values_list("title", "description")),
+            {"Imported 1": "multi\nline \u2028 text", "Imported 2": ""},
+        )
+
+    def test_import_csv_reports_undecodable_rows(self):
+        content = b'title,description\nh\xc3\xa9\n\xff\nok,"bad \xfe\nquoted"\nlast\n'
+        response = self.client.post(
+            "/api/tasks/import/",
+            {"file": SimpleUploadedFile("tasks.csv", content)},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["failed"], 2)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [3, 4])
+        self.assertIn("Invalid UTF-8", str(response.data["errors"][0]["errors"]))
+        self.assertTrue(self.user.tasks.filter(title="h\u00e9").exists())
+        self.assertTrue(self.user.tasks.filter(title="last").exists())
+
+    def test_import_round_trips_export(self):
+        exported = b"".join(self.client.get("/api/tasks/export/").streaming_content)
+        content = exported + b"\n{not json\n[1, 2]\n"
+        with override_settings(TASK_IMPORT_MAX_ERRORS=1):
+            response = self.client.post(
+                "/api/tasks/import/",
+                {"file": SimpleUploadedFile("tasks.ndjson", content)},
+                format="multipart",
+            )
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["failed"], 2)
+        self.assertEqual(len(response.data["errors"]), 1)
+        self.assertEqual(response.data["errors"][0]["line"], 4)
+        self.assertEqual(self.user.tasks.filter(title="Test Task 1").count(), 2)
+        # The cached list was invalidated.
+        response = self.client.get("/api/tasks/")
+        self.assertEqual(response.data["count"], 4)
+
+    def test_import_needs_known_format(self):
+        response = self.client.post(
+            "/api/tasks/import/",
+            {"file": SimpleUploadedFile("tasks.txt", b"title\nA\n")},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("as", response.data)
+        response = self.client.post(
+            "/api/tasks/import/?as=csv",
+            {"file": SimpleUploadedFile("tasks.txt", b"title\nA\n")},
+            format="multipart",
+        )
+        self.assertEqual(response.data["created"], 1)
+
+    def test_import_tasks_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tasks.ndjson")
+            with open(path, "wb") as file:
+                file.write(b'{"title": "From file"}\n{"title": ""}\n')
+            stdout, stderr = StringIO(), StringIO()
+            call_command(
+                "import_tasks", "TEST@example.com", path, stdout=stdout, stderr=stderr
+            )
+        self.assertIn("Imported 1 tasks, 1 rows failed", stdout.getvalue())
+        self.assertIn("Line 2:", stderr.getvalue())
+        self.assertTrue(self.user.tasks.filter(title="From file").exists())
+
+    def test_search_uses_full_text_index(self):
+        self.assertTrue(search_index_available())
+        Task.objects.create(
+            user=self.user, title="Quarterly report", description="Finance numbers"
+        )
+        Task.objects.filter(pk=self.task2.pk).update(title="Report draft")
+
+        response = self.client.get("/api/tasks/?search=repo")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = {task["title"] for task in response.data["results"]}
+        self.assertEqual(titles, {"Quarterly report", "Report draft"})
+
+        self.task2.delete()
+        response = self.client.get("/api/tasks/?search=repo fin")
+        self.assertEqual(
+            [task["title"] for task in response.data["results"]], ["Quarterly report"]
+        )
+
+    def test_search_ignores_other_users_tasks(self):
+        response = self.client.get("/api/tasks/?search=Other")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 0)
+
+    def test_bulk_create_tasks(self):
+        data = [{"title": f"Bulk {i}", "description": "Synced"} for i in range(3)]
+        response = self.client.post("/api/tasks/bulk/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 3)
+        self.assertTrue(all(task["id"] for task in response.data))
+        self.assertEqual(Task.objects.filter(user=self.user).count(), 5)
+
+    def test_bulk_create_is_all_or_nothing(self):
+        data = [{"title": "Valid"}, {"description": "Missing title"}]
+        response = self.client.post("/api/tasks/bulk/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("title", response.data[1])
+        self.assertEqual(Task.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_update_tasks(self):
+        data = [
+            {"id": self.task1.id, "title": "Bulk Updated 1"},
+            {"id": self.task2.id, "description": "Bulk Description 2"},
+        ]
+        response = self.client.patch("/api/tasks/bulk/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.task1.refresh_from_db()
+        self.task2.refresh_from_db()
+        self.assertEqual(self.task1.title, "Bulk Updated 1")
+        self.assertEqual(self.task2.title, "Test Task 2")
+        self.assertEqual(self.task2.description, "Bulk Description 2")
+
+    def test_bulk_update_rejects_other_users_tasks(self):
+        data = [{"id": self.other_task.id, "title": "Hijacked"}]
+        response = self.client.patch("/api/tasks/bulk/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.other_task.refresh_from_db()
+        self.assertEqual(self.other_task.title, "Other User Task")
+
+    def test_bulk_delete_tasks(self):
+        data = {"ids": [self.task1.id, self.other_task.id]}
+        response = self.client.delete("/api/tasks/bulk/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["deleted"], [self.task1.id])
+        self.assertEqual(response.data["not_found"], [self.other_task.id])
+        self.assertTrue(Task.objects.filter(pk=self.other_task.pk).exists())
+        self.assertFalse(Task.objects.filter(pk=self.task1.pk).exists())
+
+    def test_list_conditional_get(self):
+        response = self.client.get("/api/tasks/")
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+
+        response = self.client.get("/api/tasks/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get("/api/tasks/?search=Task", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.patch(
+            f"/api/tasks/{self.task1.id}/", {"title": "Changed"}, format="json"
+        )
+        response = self.client.get("/api/tasks/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_is_modified_by_deletes(self):
+        etag = self.client.get("/api/tasks/")["ETag"]
+        since = http_date(timezone.now().timestamp() + 60)
+        self.client.delete(f"/api/tasks/{self.task1.id}/")
+
+        response = self.client.get("/api/tasks/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get("/api/tasks/", HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+
+    def test_cursor_pages_skip_validators(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/tasks/?pagination=cursor")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("ETag", response)
+        self.assertFalse(any("MAX(" in query["sql"] for query in queries))
+
+    def test_retrieve_conditional_get(self):
+        url = f"/api/tasks/{self.task1.id}/"
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(
+            f"/api/tasks/{self.other_task.id}/", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # A sparse copy does not validate the full task.
+        sparse_etag = self.client.get(f"{url}?fields=title")["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=sparse_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("description", response.data)
+
+    def test_list_is_served_from_cache_until_tasks_change(self):
+        response = self.client.get("/api/tasks/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.client.get("/api/tasks/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["count"], 2)
+
+        self.client.post("/api/tasks/", {"title": "Fresh"}, format="json")
+        response = self.client.get("/api/tasks/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["count"], 3)
+
+        self.task1.delete()
+        response = self.client.get("/api/tasks/")
+        self.assertEqual(response.data["count"], 2)
+
+    def test_cached_bodies_match_the_etag_state(self):
+        url = f"/api/tasks/{self.task1.id}/"
+        for path in ("/api/tasks/", url):
+            self.client.get(path)
+        # A write made by a worker whose generation bump this one missed.
+        with mock.patch("tasks.cache.bump_generation"):
+            self.client.patch(url, {"title": "Elsewhere"}, format="json")
+
+        response = self.client.get("/api/tasks/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn("Elsewhere", [task["title"] for task in response.data["results"]])
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["title"], "Elsewhere")
+
+        # Cursor pages have no state to key on, so a local cache is skipped.
+        self.client.get("/api/tasks/?pagination=cursor")
+        response = self.client.get("/api/tasks/?pagination=cursor")
+        self.assertNotIn("X-Cache", response)
+
+    def test_bulk_writes_invalidate_cached_detail(self):
+        url = f"/api/tasks/{self.task1.id}/"
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+
+        self.client.patch(
+            "/api/tasks/bulk/",
+            [{"id": self.task1.id, "title": "Bulk Renamed"}],
+            format="json",
+        )
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["title"], "Bulk Renamed")
+
+
+class AttachmentTestMixin:
+    """
+    Runs each test with a fresh MEDIA_ROOT and an authenticated client.
+    """
+
+    def setUp(self):
+        caches[settings.TASK_CACHE_ALIAS].clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            ATTACHMENT_UPLOAD_TEMP_DIR=os.path.join(self.media_root, "chunks"),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", email="test@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user=self.user)
+
+
+class AttachmentStorageTests(AttachmentTestMixin, TestCase):
+    def upload(self, title, content, filename="report.pdf"):
+        response = self.client.post(
+            "/api/tasks/",
+            {"title": title, "attachment": SimpleUploadedFile(filename, content)},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Task.objects.get(pk=response.data["id"])
+
+    def test_duplicate_uploads_share_one_blob(self):
+        first = self.upload("First", b"same content")
+        second = self.upload("Second", b"same content", filename="copy.PDF")
+        digest = hashlib.sha256(b"same content").hexdigest()
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertEqual(
+            first.attachment.name,
+            f"task_attachments/{digest[:2]}/{digest[2:4]}/{digest}.pdf",
+        )
+        # Each task keeps the name it was uploaded with.
+        self.assertEqual(
+            (first.attachment_name, second.attachment_name), ("report.pdf", "copy.PDF")
+        )
+        response = self.client.get(f"/api/tasks/{second.pk}/")
+        self.assertEqual(response.data["attachment_name"], "copy.PDF")
+        response = self.client.patch(
+            f"/api/tasks/{second.pk}/", {"attachment": None}, format="json"
+        )
+        self.assertEqual(response.data["attachment_name"], "")
+
+        path = first.attachment.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        # Kept while a task being saved might still use it.
+        os.utime(path, (0, 0))
+        self.upload("Third", b"same content")
+        second.delete()
+        self.assertTrue(os.path.exists(path))
+
+        os.utime(path, (0, 0))
+        Task.objects.get(title="Third").delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_dedupe_attachments_command(self):
+        legacy_dir = os.path.join(self.media_root, "task_attachments")
+        os.makedirs(legacy_dir)
+        tasks = []
+        for filename in ("a.txt", "b.txt"):
+            with open(os.path.join(legacy_dir, filename), "wb") as f:
+                f.write(b"legacy content")
+            task = Task.objects.create(user=self.user, title=filename)
+            Task.objects.filter(pk=task.pk).update(
+                attachment=f"task_attachments/{filename}"
+            )
+            tasks.append(task)
+        orphan = attachment_storage.save(
+            "task_attachments/orphan.txt", ContentFile(b"nobody uses me")
+        )
+        os.utime(attachment_storage.path(orphan), (0, 0))
+
+        call_command("dedupe_attachments", stdout=StringIO())
+
+        names = {task.attachment.name for task in Task.objects.all()}
+        self.assertEqual(len(names), 1)
+        self.assertEqual(
+            sorted(Task.objects.values_list("attachment_name", flat=True)),
+            ["a.txt", "b.txt"],
+        )
+        blob = names.pop()
+        self.assertTrue(attachment_storage.exists(blob))
+        self.assertFalse(os.path.exists(os.path.join(legacy_dir, "a.txt")))
+        self.assertFalse(attachment_storage.exists(orphan))
+
+        # Blobs reused since their task was deleted are not collected.
+        path = attachment_storage.path(blob)
+        Task.objects.all().delete()
+        os.utime(path, (0, 0))
+        attachment_storage.save(
+            "task_attachments/again.txt", ContentFile(b"legacy content")
+        )
+        call_command("dedupe_attachments", stdout=StringIO())
+        self.assertTrue(os.path.exists(path))
+
+
+class ResumableUploadTests(AttachmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.task = Task.objects.create(user=self.user, title="Has attachment")
+        self.content = b"0123456789" * 10
+        self.digest = hashlib.sha256(self.content).hexdigest()
+
+    def start(self):
+        response = self.client.post(
+            "/api/tasks/uploads/",
+            {"filename": "notes.txt", "size": len(self.content)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return f"/api/tasks/uploads/{response.data['id']}/"
+
+    def put_chunk(self, url, start, end):
+        return self.client.put(
+            url,
+            self.content[start : end + 1],
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {start}-{end}/{len(self.content)}",
+        )
+
+    def test_chunked_upload_resume_and_finalize(self):
+        url = self.start()
+        response = self.put_chunk(url, 0, 39)
+        self.assertEqual(response.data["offset"], 40)
+
+        # A chunk that skips ahead is rejected with the offset to resume from.
+        response = self.put_chunk(url, 60, 99)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["offset"], 40)
+        self.assertEqual(self.client.get(url).data["offset"], 40)
+
+        response = self.client.post(
+            f"{url}finalize/", {"task": self.task.pk, "sha256": self.digest}
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.assertEqual(self.put_chunk(url, 40, 99).data["offset"], 100)
+        response = self.client.post(
+            f"{url}finalize/", {"task": self.task.pk, "sha256": "0" * 64}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            f"{url}finalize/", {"task": self.task.pk, "sha256": self.digest}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.attachment.name.endswith(f"{self.digest}.txt"))
+        self.assertEqual(self.task.attachment_name, "notes.txt")
+        with self.task.attachment.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_uploads_are_private(self):
+        url = self.start()
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            self.put_chunk(url, 0, 9).status_code, status.HTTP_404_NOT_FOUND
+        )
+
+    @override_settings(ATTACHMENT_UPLOAD_MAX_OPEN=2)
+    def test_open_uploads_are_limited(self):
+        first = self.start()
+        self.start()
+        response = self.client.post(
+            "/api/tasks/uploads/", {"filename": "a.txt", "size": 1}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Expired uploads do not count, and are gone.
+        AttachmentUpload.objects.filter(pk=first.split("/")[-2]).update(
+            updated_at=timezone.now() - timedelta(days=2)
+        )
+        self.assertEqual(self.client.get(first).status_code, status.HTTP_404_NOT_FOUND)
+        self.start()
+        self.assertEqual(self.user.attachment_uploads.count(), 2)
+
+    def test_cleanup_uploads(self):
+        expired = AttachmentUpload.objects.get(pk=self.start().split("/")[-2])
+        current = AttachmentUpload.objects.get(pk=self.start().split("/")[-2])
+        AttachmentUpload.objects.filter(pk=expired.pk).update(
+            updated_at=timezone.now() - timedelta(days=2)
+        )
+        orphan = os.path.join(
+            settings.ATTACHMENT_UPLOAD_TEMP_DIR, f"{uuid.uuid4()}.part"
+        )
+        open(orphan, "wb").close()
+        os.utime(orphan, (0, 0))
+
+        out = StringIO()
+        call_command("cleanup_uploads", stdout=out)
+        self.assertIn("deleted 1 expired uploads and 1 orphaned", out.getvalue())
+        self.assertFalse(AttachmentUpload.objects.filter(pk=expired.pk).exists())
+        self.assertFalse(os.path.exists(expired.path))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(current.path))
+
+
+class AttachmentDownloadTests(AttachmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = bytes(range(256)) * 4
+        self.task = Task.objects.create(user=self.user, title="Quarterly report")
+        self.task.attachment.save("report.pdf", ContentFile(self.content))
+        self.url = f"/api/tasks/{self.task.pk}/download/"
+
+    def test_tasks_link_to_the_download(self):
+        response = self.client.get(f"/api/tasks/{self.task.pk}/")
+        self.assertEqual(response.data["download_url"], f"http://testserver{self.url}")
+        response = self.client.get("/api/tasks/", HTTP_ACCEPT="application/json")
+        self.assertEqual(
+            response.data["results"][0]["download_url"], f"http://testserver{self.url}"
+        )
+        self.task.attachment = ""
+        self.task.save()
+        response = self.client.get(f"/api/tasks/{self.task.pk}/")
+        self.assertIsNone(response.data["download_url"])
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn(
+            'filename="Quarterly_report.pdf"', response["Content-Disposition"]
+        )
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response["Content-Range"], "bytes 100-199/1024")
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(b"".join(response.streaming_content), self.content[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-24")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-24:])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2048-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+
+        # A stale If-Range falls back to the whole file.
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(ATTACHMENT_SENDFILE_BACKEND="x-accel-redirect")
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            f"/protected-media/{self.task.attachment.name}",
+        )
+        self.assertEqual(response.content, b"")
+
+    def test_only_owner_can_download(self):
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user=other)
+        self.assertEqual(
+            self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND
+        )
+
+
+@override_settings(TASK_JOBS_ALWAYS_EAGER=True, TASK_THUMBNAIL_SIZE=32)
+class ThumbnailTests(AttachmentTestMixin, TestCase):
+    def upload(self, filename, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/tasks/",
+                {"title": "Photo", "attachment": SimpleUploadedFile(filename, content)},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def test_thumbnail_generated_after_upload(self):
+        buffer = BytesIO()
+        Image.new("RGBA", (400, 200), (255, 0, 0, 128)).save(buffer, "PNG")
+        data = self.upload("photo.png", buffer.getvalue())
+        digest = hashlib.sha256(buffer.getvalue()).hexdigest()
+        self.assertTrue(data["thumbnail_url"].endswith(f"?v={digest[:16]}"))
+        name = thumbnail_name(digest)
+        self.assertTrue(attachment_storage.exists(name))
+
+        response = self.client.get(data["thumbnail_url"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (32, 16))
+
+        # Missing thumbnails are rendered again on request.
+        attachment_storage.delete(name)
+        response = self.client.get(f"/api/tasks/{data['id']}/thumbnail/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(attachment_storage.exists(name))
+
+        task = Task.objects.get(pk=data["id"])
+        os.utime(task.attachment.path, (0, 0))
+        task.delete()
+        self.assertFalse(attachment_storage.exists(name))
+
+    def test_no_thumbnail_for_other_files(self):
+        data = self.upload("notes.txt", b"not an image")
+        self.assertIsNone(data["thumbnail_url"])
+        response = self.client.get(f"/api/tasks/{data['id']}/thumbnail/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        data = self.upload("broken.png", b"not an image either")
+        response = self.client.get(data["thumbnail_url"])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(TASK_SHARDS=["default", "tasks_shard1", "tasks_shard2"])
+class TaskShardRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = TaskShardRouter()
+
+    def test_users_map_to_a_stable_shard(self):
+        shards = {shard_for_user(user_id) for user_id in range(1, 200)}
+        self.assertEqual(shards, set(settings.TASK_SHARDS))
+        self.assertEqual(shard_for_user(42), shard_for_user(42))
+        with override_settings(TASK_SHARDS=["default"]):
+            self.assertEqual(shard_for_user(42), "default")
+
+    def test_routes_by_user_or_task_hint(self):
+        user = User(pk=42)
+        shard = shard_for_user(42)
+        self.assertEqual(self.router.db_for_read(Task, instance=user), shard)
+        self.assertEqual(
+            self.router.db_for_write(Task, instance=Task(user_id=42)), shard
+        )
+        self.assertIsNone(self.router.db_for_read(Task))
+        self.assertIsNone(self.router.db_for_read(User, instance=user))
+
+    def test_id_ranges_and_migrations(self):
+        self.assertEqual(shard_for_task_id(5), "default")
+        self.assertEqual(shard_for_task_id(2 * TASK_SHARD_ID_SPAN + 5), "tasks_shard2")
+        self.assertTrue(self.router.allow_migrate("tasks_shard1", "tasks", "task"))
+        self.assertFalse(self.router.allow_migrate("tasks_shard1", "auth", "user"))
+        self.assertIsNone(self.router.allow_migrate("default", "auth", "user"))
+
+
+SHARD = "tasks_shard1"
+
+
+@override_settings(TASK_SHARDS=["default", SHARD])
+class ShardedTaskTests(TestCase):
+    """
+    Runs against a second task shard, a temporary SQLite file set up like
+    the ones in TASK_SHARD_DATABASES.
+    """
+
+    # Resolved in setUpClass(), once the shard's connection exists; the test
+    # runner only sets up the databases in settings.DATABASES.
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        connections.settings[SHARD] = {
+            **connections.settings["default"],
+            "NAME": os.path.join(directory.name, "shard1.sqlite3"),
+        }
+        cls.addClassCleanup(connections.settings.pop, SHARD)
+        cls.addClassCleanup(connections.__delitem__, SHARD)
+        cls.addClassCleanup(connections[SHARD].close)
+        with override_settings(TASK_SHARDS=["default", SHARD]):
+            call_command("migrate", database=SHARD, run_syncdb=True, verbosity=0)
+        super().setUpClass()
+
+    def setUp(self):
+        caches[settings.TASK_CACHE_ALIAS].clear()
+        users = [User.objects.create_user(username=f"user{i}") for i in range(8)]
+        self.local = next(u for u in users if shard_for_user(u.pk) == "default")
+        self.remote = next(u for u in users if shard_for_user(u.pk) == SHARD)
+
+    def test_tasks_are_written_to_their_users_shard(self):
+        task = Task.objects.create(user=self.remote, title="Remote")
+        self.assertTrue(Task.objects.using(SHARD).filter(pk=task.pk).exists())
+        self.assertFalse(Task.objects.using("default").filter(pk=task.pk).exists())
+        # Allocated from the shard's own id range.
+        self.assertEqual(shard_for_task_id(task.pk), SHARD)
+
+        Task.objects.bulk_create(
+            [Task(user=self.local, title="Local"), Task(user=self.remote, title="Too")]
+        )
+        self.assertEqual(
+            sorted(Task.objects.using(SHARD).values_list("title", flat=True)),
+            ["Remote", "Too"],
+        )
+        self.assertEqual(self.local.tasks.get().title, "Local")
+        self.assertEqual(self.remote.tasks.count(), 2)
+
+    def test_deleting_a_user_deletes_their_tasks_on_another_shard(self):
+        Task.objects.create(user=self.remote, title="Remote")
+        self.remote.delete()
+        self.assertFalse(Task.objects.using(SHARD).exists())
+
+    def test_reserve_id_range(self):
+        set_id_sequence(SHARD, 5)
+        self.assertTrue(reserve_id_range(SHARD))
+        self.assertEqual(get_id_sequence(SHARD), TASK_SHARD_ID_SPAN)
+        set_id_sequence(SHARD, TASK_SHARD_ID_SPAN + 7)
+        reserve_id_range(SHARD)
+        self.assertEqual(get_id_sequence(SHARD), TASK_SHARD_ID_SPAN + 7)
+        self.assertFalse(reserve_id_range("tasks_shard9"))
+
+    def test_rebalance_moves_tasks_to_their_users_shard(self):
+        # Written before the shard existed.
+        moved = Task.objects.using("default").create(user=self.remote, title="Old")
+        kept = Task.objects.create(user=self.local, title="Stays")
+
+        out = StringIO()
+        call_command("rebalance_task_shards", batch_size=1, stdout=out)
+        self.assertIn("Moved 1 tasks of 1 users.", out.getvalue())
+        self.assertEqual(
+            list(Task.objects.using("default").values_list("pk", flat=True)),
+            [kept.pk],
+        )
+        copy = Task.objects.using(SHARD).get()
+        self.assertEqual(
+            (copy.pk, copy.title, copy.created_at, copy.updated_at),
+            (moved.pk, moved.title, moved.created_at, moved.updated_at),
+        )
+        # New tasks on the shard still get ids from its range.
+        self.assertEqual(
+            shard_for_task_id(Task.objects.create(user=self.remote, title="New").pk),
+            SHARD,
+        )
+
+    def test_invalidation_waits_for_the_shard_commit(self):
+        with self.captureOnCommitCallbacks(using=SHARD) as callbacks:
+            with transaction.atomic(using=SHARD):
+                Task.objects.create(user=self.remote, title="Remote")
+        self.assertEqual(len(callbacks), 1)
+
+        generation = get_generation(self.remote.pk)
+        callbacks[0]()
+        self.assertEqual(get_generation(self.remote.pk), generation + 1)
@@ -0,0 +1,99 @@
+"""
+Thumbnails for image attachments.
+
+Thumbnails are JPEGs no larger than TASK_THUMBNAIL_SIZE pixels a side, stored
+under ``task_thumbnails/`` and named after the SHA-256 of the attachment, so
+tasks sharing a blob share its thumbnail and a changed file gets a new one.
+They are generated on the job pool after an upload and lazily by the
+thumbnail endpoint when missing.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import attachment_storage
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_DIR = "task_attachments"
+THUMBNAIL_DIR = "task_thumbnails"
+IMAGE_EXTENSIONS = {".bmp", ".gif", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
+
+
+def is_image_name(name):
+    return bool(name) and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def blob_digest(name):
+    """
+    Returns the content digest in a content-addressed attachment name, or
+    None for names that predate content addressing.
+    """
+    if attachment_storage.is_blob_name(name, ATTACHMENT_DIR):
+        return os.path.splitext(os.path.basename(name))[0]
+    return None
+
+
+def thumbnail_name(digest):
+    size = settings.TASK_THUMBNAIL_SIZE
+    return f"{THUMBNAIL_DIR}/{digest[:2]}/{digest[2:4]}/{digest}-{size}.jpg"
+
+
+def generate_thumbnail(name):
+    """
+    Returns the thumbnail name for attachment ``name``, rendering it first if
+    needed, or None when the attachment is not a readable image.
+    """
+    if not is_image_name(name) or not attachment_storage.exists(name):
+        return None
+    digest = blob_digest(name)
+    if digest is None:
+        with attachment_storage.open(name) as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    thumb = thumbnail_name(digest)
+    if attachment_storage.exists(thumb):
+        return thumb
+
+    size = settings.TASK_THUMBNAIL_SIZE
+    try:
+        with Image.open(attachment_storage.path(name)) as image:
+            # Let the JPEG decoder downscale while decoding.
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            path = attachment_storage.path(thumb)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".jpg")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    image.save(f, "JPEG", quality=80, optimize=True)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.info("Could not render a thumbnail for %s: %s", name, exc)
+        return None
+    return thumb
+
+
+def delete_thumbnails(name):
+    """
+    Removes the thumbnail of a deleted attachment blob.
+    """
+    digest = blob_digest(name)
+    if digest is not None and attachment_storage.exists(thumbnail_name(digest)):
+        attachment_storage.delete(thumbnail_name(digest))
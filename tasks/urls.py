@@ -1,10 +1,12 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import TaskViewSet
+from .views import AttachmentUploadViewSet, TaskViewSet
 
 # Create a router and register our viewsets with it.
 router = DefaultRouter()
+# Registered before the tasks so "uploads/" is not taken for a task id.
+router.register(r"uploads", AttachmentUploadViewSet, basename="attachment-upload")
 router.register(r"", TaskViewSet, basename="task")
 
 # The API URLs are now determined automatically by the router.
@@ -1,12 +1,57 @@
+import hashlib
+import os
+import re
 from datetime import timedelta
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from rest_framework import permissions, status, viewsets
+from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
-from .models import Task
-from .serializers import TaskSerializer
+from userhub.caches import get_shared_cache
+from userhub.conditional import make_etag, not_modified_response, set_validators
+from userhub.profiling import timed
+
+from .cache import (
+    cache_response_data,
+    get_cached_response_data,
+    invalidate_user_tasks,
+    response_cache_key,
+)
+from .downloads import attachment_response
+from .encoders import compile_task_encoder
+from .exports import EXPORT_FORMATS, export_response
+from .importer import IMPORT_FORMATS, guess_format, import_tasks
+from .jobs import run_deletion_job, submit
+from .models import (
+    AttachmentUpload,
+    Task,
+    TaskDeletionJob,
+    delete_attachment_files,
+)
+from .pagination import TaskKeysetPagination, TaskPagination
+from .search import TaskSearchFilter
+from .serializers import (
+    MAX_BULK_ITEMS,
+    AttachmentUploadFinalizeSerializer,
+    AttachmentUploadSerializer,
+    TaskDeletionJobSerializer,
+    TaskIdListSerializer,
+    TaskSerializer,
+)
+from .storage import LocalFile, attachment_storage
+from .thumbnails import generate_thumbnail
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (?P<start>\d+)-(?P<end>\d+)/(?P<size>\d+|\*)$")
 
 
 class TaskViewSet(viewsets.ModelViewSet):
@@ -16,29 +61,511 @@ class TaskViewSet(viewsets.ModelViewSet):
 
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [TaskSearchFilter, OrderingFilter]
     search_fields = ["title", "description"]
+    # Actions accepting ?fields= and ?exclude=.
+    sparse_fieldset_actions = ["list", "retrieve", "export"]
+    # Loaded even when not requested: ordering and keyset cursors read
+    # created_at, and the shard router reads user_id.
+    always_loaded_fields = ["id", "user", "created_at"]
+
+    @property
+    def paginator(self):
+        """
+        Picks page-number or keyset pagination depending on the request.
+        """
+        if not hasattr(self, "_paginator"):
+            self._paginator = TaskPagination.for_request(self.request)
+        return self._paginator
 
     def get_queryset(self):
         """
         This view should return a list of all tasks for the currently authenticated user.
         """
-        return self.request.user.tasks.all().order_by("-created_at")
+        queryset = self.request.user.tasks.all().order_by("-created_at")
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            # Leave the columns of unrequested fields (e.g. long descriptions)
+            # unread.
+            queryset = queryset.only(
+                *self.always_loaded_fields, *TaskSerializer.model_fields_for(fields)
+            )
+        return queryset
+
+    def get_sparse_fields(self):
+        """
+        Returns the serializer fields picked with ?fields= and ?exclude=
+        (comma-separated names), or None to return all of them.
+        """
+        if not hasattr(self, "_sparse_fields"):
+            self._sparse_fields = None
+            params = self.request.query_params
+            if self.action in self.sparse_fieldset_actions and (
+                "fields" in params or "exclude" in params
+            ):
+                available = TaskSerializer.Meta.fields
+                fields = self.parse_field_list("fields", available) or available
+                excluded = self.parse_field_list("exclude", available)
+                self._sparse_fields = [
+                    name
+                    for name in available
+                    if name in fields and name not in excluded
+                ]
+        return self._sparse_fields
+
+    def parse_field_list(self, param, available):
+        names = [
+            name.strip()
+            for name in self.request.query_params.get(param, "").split(",")
+            if name.strip()
+        ]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValidationError({param: [f"Unknown fields: {', '.join(unknown)}."]})
+        return names
+
+    def perform_content_negotiation(self, request, force=False):
+        # export picks its format from ?as= rather than the Accept header.
+        force = force or self.action == "export"
+        return super().perform_content_negotiation(request, force=force)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs["fields"] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lists tasks, answering 304 when nothing in the result set changed.
+
+        Only an ETag is sent: the newest updated_at, the only Last-Modified
+        available, stays the same when a task is deleted. Cursor pages are
+        fetched once each while walking a list, so they skip the validators
+        and the aggregate query behind them.
+        """
+        handler = self.list_rows if settings.TASK_LIST_FAST_PATH else super().list
+        if isinstance(self.paginator, TaskKeysetPagination):
+            # Without the state to key it on, a cached page is only safe when
+            # every worker sees the same generation counter.
+            if get_shared_cache(settings.TASK_CACHE_ALIAS) is None:
+                return handler(request, *args, **kwargs)
+            return self.cached(handler, request, *args, **kwargs)
+
+        state = self.filter_queryset(self.get_queryset()).aggregate(
+            last_modified=Max("updated_at"), count=Count("id")
+        )
+        etag = make_etag(
+            request.user.pk,
+            request.get_full_path(),
+            state["count"],
+            state["last_modified"] and state["last_modified"].isoformat(),
+        )
+        response = not_modified_response(request, etag)
+        if response is None:
+            response = self.cached(handler, request, *args, etag=etag, **kwargs)
+            set_validators(response, etag)
+        return response
+
+    def list_rows(self, request, *args, **kwargs):
+        """
+        Lists tasks like ListModelMixin.list(), but from values() rows encoded
+        by tasks.encoders rather than through TaskSerializer, which costs a
+        model instance and a pass of DRF's field machinery per row.
+        """
+        fields = self.get_sparse_fields()
+        if fields is None:
+            fields = TaskSerializer.Meta.fields
+        # id and created_at are read by keyset cursors.
+        columns = {"id", "created_at", *TaskSerializer.model_fields_for(fields)}
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        encode = compile_task_encoder(fields, request)
+
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset if page is None else page)
+        with timed("serialize"):
+            data = [encode(row) for row in rows]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Returns a task, answering 304 when it is unchanged.
+        """
+        try:
+            updated_at = (
+                self.get_queryset()
+                .filter(pk=kwargs[self.lookup_field])
+                .values_list("updated_at", flat=True)
+                .first()
+            )
+        except (TypeError, ValueError):
+            updated_at = None
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        # The path carries ?fields=/?exclude=, which change the body.
+        etag = make_etag(request.user.pk, request.get_full_path(), updated_at)
+        response = not_modified_response(request, etag, updated_at)
+        if response is None:
+            response = self.cached(
+                super().retrieve, request, *args, etag=etag, **kwargs
+            )
+            set_validators(response, etag, updated_at)
+        return response
+
+    def cached(self, handler, request, *args, etag=None, **kwargs):
+        """
+        Serves a read from the per-user response cache, filling it on a miss.
+        """
+        key = response_cache_key(request, self.action, etag)
+        data = get_cached_response_data(key)
+        if data is not None:
+            return Response(data, headers={"X-Cache": "HIT"})
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache_response_data(key, response.data)
+        response["X-Cache"] = "MISS"
+        return response
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Streams all of the user's tasks, filtered by ?search= and ordered by
+        ?ordering=, as NDJSON or, with ?as=csv, as CSV.
+        """
+        export_format = request.query_params.get("as", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"as": [f"Expected one of: {', '.join(EXPORT_FORMATS)}."]}
+            )
+        fields = self.get_sparse_fields()
+        if fields is None:
+            fields = TaskSerializer.Meta.fields
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(request, queryset, fields, export_format)
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        """
+        Streams the task's attachment, with byte-range support for resuming.
+        """
+        task = self.get_object()
+        response = None
+        if task.attachment:
+            response = attachment_response(request, task)
+        if response is None:
+            raise Http404("This task has no attachment.")
+        return response
+
+    @action(detail=True, methods=["get"])
+    def thumbnail(self, request, pk=None):
+        """
+        Serves the thumbnail of an image attachment, rendering it on a miss.
+        """
+        task = self.get_object()
+        name = generate_thumbnail(task.attachment.name)
+        if name is None:
+            raise Http404("This task has no image attachment.")
+
+        etag = make_etag(name)
+        response = not_modified_response(request, etag)
+        if response is None:
+            response = FileResponse(
+                attachment_storage.open(name), content_type="image/jpeg"
+            )
+            set_validators(response, etag)
+        if "v" in request.query_params:
+            # thumbnail_url changes with the attachment's content.
+            response["Cache-Control"] = "private, max-age=31536000, immutable"
+        else:
+            response["Cache-Control"] = "private, no-cache"
+        return response
 
     def perform_create(self, serializer):
         """Associates the task with the logged-in user upon creation."""
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """
+        Creates a list of tasks in a single transaction.
+        """
+        serializer = self.get_serializer(
+            data=request.data, many=True, allow_empty=False, max_length=MAX_BULK_ITEMS
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(user=request.user)
+            invalidate_user_tasks(request.user.pk)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        url_name="import",
+        parser_classes=[MultiPartParser],
+    )
+    def import_file(self, request):
+        """
+        Creates tasks from an uploaded CSV or NDJSON "file" (format from ?as=
+        or the file extension) and reports the rows that failed validation.
+        Valid rows are imported even when others fail.
+        """
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": ["No file was submitted."]})
+        import_format = request.query_params.get("as") or guess_format(upload.name)
+        if import_format not in IMPORT_FORMATS:
+            raise ValidationError(
+                {"as": [f"Expected one of: {', '.join(IMPORT_FORMATS)}."]}
+            )
+        report = import_tasks(request.user, upload, import_format)
+        return Response(report)
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """
+        Partially updates a list of tasks, each identified by its "id".
+        """
+        items = request.data
+        if not isinstance(items, list) or not items or len(items) > MAX_BULK_ITEMS:
+            return Response(
+                {"detail": f"Expected a list of 1 to {MAX_BULK_ITEMS} tasks."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+        ids = [
+            pk if isinstance(pk, int) and not isinstance(pk, bool) else None
+            for pk in ids
+        ]
+        tasks = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+        errors, seen = [], set()
+        for pk in ids:
+            if pk not in tasks:
+                errors.append({"id": ["Task not found."]})
+            elif pk in seen:
+                errors.append({"id": ["Duplicate task id."]})
+            else:
+                errors.append({})
+            seen.add(pk)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(
+            [tasks[pk] for pk in ids], data=items, many=True, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+            invalidate_user_tasks(request.user.pk)
+        return Response(serializer.data)
+
+    @bulk.mapping.delete
+    def bulk_delete(self, request):
+        """
+        Deletes the tasks whose ids are listed in "ids".
+        """
+        serializer = TaskIdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
 
+        with transaction.atomic():
+            tasks = self.get_queryset().filter(id__in=ids)
+            found = dict(tasks.values_list("id", "attachment"))
+            tasks.delete()
+            invalidate_user_tasks(request.user.pk)
+            attachments = [name for name in found.values() if name]
+            transaction.on_commit(lambda: delete_attachment_files(attachments))
+
+        return Response(
+            {
+                "deleted": sorted(found),
+                "not_found": sorted(set(ids) - set(found)),
+            }
+        )
 
     @action(detail=False, methods=["delete"], url_path="delete-all")
     def delete_all(self, request):
         """
-        Deletes all tasks for the current user.
+        Starts a background job that deletes all tasks for the current user.
+        """
+        job = request.user.task_deletion_jobs.filter(
+            status__in=[TaskDeletionJob.PENDING, TaskDeletionJob.RUNNING]
+        ).first()
+        if job is not None and job.is_stale():
+            TaskDeletionJob.objects.filter(pk=job.pk).update(
+                status=TaskDeletionJob.FAILED,
+                error="Abandoned without progress; a new job was started.",
+                updated_at=timezone.now(),
+            )
+            job = None
+        if job is None:
+            last_task_id = request.user.tasks.aggregate(last=Max("id"))["last"]
+            job = TaskDeletionJob.objects.create(
+                user=request.user, last_task_id=last_task_id or 0
+            )
+            transaction.on_commit(lambda: submit(run_deletion_job, job.pk))
+
+        data = TaskDeletionJobSerializer(job).data
+        data["status_url"] = reverse(
+            "task-delete-all-status", kwargs={"job_id": job.pk}, request=request
+        )
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"delete-all/(?P<job_id>\d+)",
+        url_name="delete-all-status",
+    )
+    def delete_all_status(self, request, job_id=None):
+        """
+        Reports the progress of a delete_all job.
+        """
+        job = get_object_or_404(request.user.task_deletion_jobs, pk=job_id)
+        return Response(TaskDeletionJobSerializer(job).data)
+
+
+class AttachmentUploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Resumable chunked attachment uploads.
+
+    POST creates an upload, PUT with a ``Content-Range: bytes start-end/size``
+    header appends a chunk at the current offset, GET reports the offset to
+    resume from, and ``finalize`` verifies the checksum and attaches the file
+    to a task. Chunks are streamed straight to disk.
+    """
+
+    serializer_class = AttachmentUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    chunk_read_size = 64 * 1024
+
+    def get_queryset(self):
+        return self.request.user.attachment_uploads.filter(
+            updated_at__gte=AttachmentUpload.expiry_cutoff()
+        )
+
+    def perform_create(self, serializer):
+        uploads = self.request.user.attachment_uploads
+        for upload in uploads.filter(updated_at__lt=AttachmentUpload.expiry_cutoff()):
+            upload.delete()
+        if uploads.count() >= settings.ATTACHMENT_UPLOAD_MAX_OPEN:
+            raise ValidationError(
+                f"At most {settings.ATTACHMENT_UPLOAD_MAX_OPEN} uploads may be in "
+                "progress. Finalize or delete one first."
+            )
+        upload = serializer.save(user=self.request.user)
+        os.makedirs(os.path.dirname(upload.path), exist_ok=True)
+        open(upload.path, "wb").close()
+
+    def update(self, request, *args, **kwargs):
+        """
+        Appends the request body to the upload at the offset it names.
+        """
+        upload = self.get_object()
+        match = CONTENT_RANGE_RE.match(request.headers.get("Content-Range", ""))
+        if match is None:
+            return Response(
+                {
+                    "detail": "A 'Content-Range: bytes start-end/size' header is required."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        start, end = int(match["start"]), int(match["end"])
+        if start != upload.offset:
+            return Response(
+                {
+                    "detail": "Chunk does not start at the upload offset.",
+                    "offset": upload.offset,
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+        if (
+            end < start
+            or end >= upload.size
+            or (match["size"] != "*" and int(match["size"]) != upload.size)
+        ):
+            return Response(
+                {"detail": "Content-Range does not fit the upload."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        remaining = end - start + 1
+        with open(upload.path, "r+b") as f:
+            # Drop bytes from an earlier chunk that was never acknowledged.
+            f.truncate(start)
+            f.seek(start)
+            while remaining:
+                data = request.stream.read(min(self.chunk_read_size, remaining))
+                if not data:
+                    break
+                f.write(data)
+                remaining -= len(data)
+            upload.offset = f.tell()
+        upload.save(update_fields=["offset", "updated_at"])
+
+        if remaining:
+            return Response(
+                {
+                    "detail": "Chunk body was shorter than its Content-Range.",
+                    "offset": upload.offset,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=["post"])
+    def finalize(self, request, pk=None):
+        """
+        Verifies the complete upload and attaches it to one of the user's tasks.
         """
-        tasks_to_delete = self.get_queryset()
-        count = tasks_to_delete.count()
-        tasks_to_delete.delete()
+        upload = self.get_object()
+        serializer = AttachmentUploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        task = get_object_or_404(
+            request.user.tasks, pk=serializer.validated_data["task"]
+        )
+
+        if upload.offset != upload.size:
+            return Response(
+                {"detail": "Upload is incomplete.", "offset": upload.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        expected = serializer.validated_data.get("sha256", upload.sha256).lower()
+        if not expected:
+            return Response(
+                {"sha256": ["A SHA-256 checksum is required."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        hasher = hashlib.sha256()
+        with open(upload.path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_read_size), b""):
+                hasher.update(chunk)
+        if hasher.hexdigest() != expected:
+            return Response(
+                {"sha256": ["Checksum does not match the uploaded data."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        previous = task.attachment.name
+        task.attachment_name = upload.filename
+        with LocalFile(upload.path, upload.filename, content_hash=expected) as f:
+            task.attachment.save(upload.filename, f, save=True)
+        upload.delete()
+        if previous != task.attachment.name:
+            delete_attachment_files([previous])
+
         return Response(
-            {"detail": f"{count} tasks were deleted."},
-            status=status.HTTP_204_NO_CONTENT,
+            TaskSerializer(task, context=self.get_serializer_context()).data
         )
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "userhub.settings")
+# Use the async auth views, which hash passwords on a process pool.
+os.environ.setdefault("ASYNC_AUTH_VIEWS", "True")
 
 application = get_asgi_application()
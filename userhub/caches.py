@@ -0,0 +1,27 @@
+"""
+Caches that hold state every worker process must see, e.g. the writes that
+make a user's reads stick to the primary, or the version stamps that
+invalidate users cached in each process.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Backends whose entries are only seen by the process that wrote them, or
+# by no process at all.
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def get_shared_cache(alias):
+    """
+    Returns the cache ``alias`` if it is configured with a backend shared by
+    the worker processes, otherwise None.
+    """
+    if not alias or alias not in settings.CACHES:
+        return None
+    cache = caches[alias]
+    if isinstance(cache, PROCESS_LOCAL_BACKENDS):
+        return None
+    return cache
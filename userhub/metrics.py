@@ -0,0 +1,504 @@
+"""
+Application metrics in the Prometheus text format.
+
+Metrics are declared at module level where they are recorded::
+
+    logins = metrics.counter("userhub_logins_total", "Logins.", ["result"])
+    logins.inc(result="ok")
+
+With METRICS_ENABLED, ``MetricsMiddleware`` records the rate, latency and
+database time of requests per URL name, and ``/metrics/`` serves everything
+to the addresses in METRICS_ALLOWED_IPS.
+
+Under a multi-process server, set METRICS_DIR to a directory shared by the
+workers (and emptied when the server starts). Each process then keeps its
+values in its own memory-mapped file there, so writes never wait on another
+process, and the exporter adds up the files of all processes. Gauges only
+count for processes that are still alive. Without METRICS_DIR, values live
+in the current process only.
+"""
+
+import glob
+import hmac
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+from .profiling import install_query_wrapper
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FILE_PATTERN = "metrics-{}.db"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MemoryValues:
+    """
+    Sample values of this process, in a dict.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+def read_entries(data, used):
+    """
+    Yields ``(key, value, value_offset)`` for the entries of a values file.
+    """
+    position = 8
+    while position < used:
+        (length,) = struct.unpack_from("i", data, position)
+        key = bytes(data[position + 4 : position + 4 + length]).decode()
+        offset = position + 4 + length
+        offset += -offset % 8
+        (value,) = struct.unpack_from("d", data, offset)
+        yield key, value, offset
+        position = offset + 8
+
+
+class MmapValues:
+    """
+    Sample values of this process, in a memory-mapped file only it writes.
+
+    The file starts with the number of bytes in use, followed by one entry
+    per sample: the key's length, the UTF-8 key padded to 8 bytes and the
+    value as a double. The used size is written last, so readers never see
+    a half-written entry.
+    """
+
+    initial_size = 64 * 1024
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size < self.initial_size:
+            os.ftruncate(self._fd, self.initial_size)
+            size = self.initial_size
+        self._mmap = mmap.mmap(self._fd, size)
+        self._used = struct.unpack_from("i", self._mmap, 0)[0] or 8
+        self._offsets = {
+            key: offset for key, _, offset in read_entries(self._mmap, self._used)
+        }
+
+    def _offset(self, key):
+        offset = self._offsets.get(key)
+        if offset is None:
+            encoded = key.encode()
+            offset = self._used + 4 + len(encoded)
+            offset += -offset % 8
+            end = offset + 8
+            if end > len(self._mmap):
+                size = max(2 * len(self._mmap), end)
+                self._mmap.close()
+                os.ftruncate(self._fd, size)
+                self._mmap = mmap.mmap(self._fd, size)
+            struct.pack_into(
+                f"i{len(encoded)}s", self._mmap, self._used, len(encoded), encoded
+            )
+            struct.pack_into("d", self._mmap, offset, 0.0)
+            self._used = end
+            struct.pack_into("i", self._mmap, 0, end)
+            self._offsets[key] = offset
+        return offset
+
+    def add(self, key, amount):
+        with self._lock:
+            offset = self._offset(key)
+            (value,) = struct.unpack_from("d", self._mmap, offset)
+            struct.pack_into("d", self._mmap, offset, value + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            struct.pack_into("d", self._mmap, self._offset(key), value)
+
+    def items(self):
+        with self._lock:
+            return [
+                (key, value) for key, value, _ in read_entries(self._mmap, self._used)
+            ]
+
+
+def read_values_file(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < 8:
+        return []
+    (used,) = struct.unpack_from("i", data, 0)
+    return [(key, value) for key, value, _ in read_entries(data, used)]
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+
+    def key(self, suffix, labels, extra=()):
+        cache_key = (suffix, tuple(sorted(labels.items())), extra)
+        key = self._keys.get(cache_key)
+        if key is None:
+            if set(labels) != set(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            pairs = [[name, str(labels[name])] for name in self.labelnames]
+            key = json.dumps(
+                [self.name, suffix, pairs + [list(pair) for pair in extra]]
+            )
+            self._keys[cache_key] = key
+        return key
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        self.registry.values().add(self.key("", labels), amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.registry.values().set(self.key("", labels), value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=None):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets or DEFAULT_BUCKETS)
+
+    def observe(self, value, **labels):
+        values = self.registry.values()
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            # Counts per bucket; they are made cumulative when exported.
+            le = format_value(self.buckets[index])
+            values.add(self.key("_bucket", labels, (("le", le),)), 1)
+        values.add(self.key("_sum", labels), value)
+        values.add(self.key("_count", labels), 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else f"{value:.1f}"
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._values = None
+
+    def register(self, metric):
+        # Declaring a metric twice (e.g. on module reload) returns the first.
+        return self.metrics.setdefault(metric.name, metric)
+
+    def values(self):
+        """
+        Returns this process' value store, opening a new one after a fork.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    if settings.METRICS_DIR:
+                        path = os.path.join(
+                            settings.METRICS_DIR, FILE_PATTERN.format(pid)
+                        )
+                        self._values = MmapValues(path)
+                    else:
+                        self._values = MemoryValues()
+                    self._pid = pid
+        return self._values
+
+    def reset(self):
+        with self._lock:
+            self._pid = None
+            self._values = None
+
+    def collect(self):
+        """
+        Returns the values of all processes, summed by key.
+        """
+        if not settings.METRICS_DIR:
+            return dict(self.values().items())
+        self.values()
+        totals = {}
+        for path in glob.glob(
+            os.path.join(settings.METRICS_DIR, FILE_PATTERN.format("*"))
+        ):
+            try:
+                pid = int(os.path.basename(path)[len("metrics-") : -len(".db")])
+            except ValueError:
+                continue
+            alive = pid_alive(pid)
+            for key, value in read_values_file(path):
+                name = key[2 : key.index('"', 2)]
+                metric = self.metrics.get(name)
+                if metric is not None and metric.kind == "gauge" and not alive:
+                    continue
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self):
+        samples = {}
+        for key, value in self.collect().items():
+            name, suffix, pairs = json.loads(key)
+            samples.setdefault(name, []).append((suffix, pairs, value))
+
+        lines = []
+        for name in sorted(self.metrics):
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            if metric.kind == "histogram":
+                lines += self.render_histogram(metric, samples.get(name, []))
+            else:
+                for suffix, pairs, value in sorted(samples.get(name, [])):
+                    lines.append(
+                        f"{name}{suffix}{format_labels(pairs)} {format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def render_histogram(self, metric, samples):
+        series = {}
+        for suffix, pairs, value in samples:
+            if suffix == "_bucket":
+                labels = tuple(map(tuple, pairs[:-1]))
+                series.setdefault(labels, {}).setdefault("buckets", {})[
+                    pairs[-1][1]
+                ] = value
+            else:
+                series.setdefault(tuple(map(tuple, pairs)), {})[suffix] = value
+
+        lines = []
+        for labels, data in sorted(series.items()):
+            cumulative = 0.0
+            buckets = data.get("buckets", {})
+            for bound in metric.buckets:
+                le = format_value(bound)
+                cumulative += buckets.get(le, 0.0)
+                lines.append(
+                    f"{metric.name}_bucket{format_labels(labels + (('le', le),))} "
+                    f"{format_value(cumulative)}"
+                )
+            count = data.get("_count", 0.0)
+            lines.append(
+                f"{metric.name}_bucket{format_labels(labels + (('le', '+Inf'),))} "
+                f"{format_value(count)}"
+            )
+            lines.append(
+                f"{metric.name}_sum{format_labels(labels)} {format_value(data.get('_sum', 0.0))}"
+            )
+            lines.append(
+                f"{metric.name}_count{format_labels(labels)} {format_value(count)}"
+            )
+        return lines
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(REGISTRY, name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(REGISTRY, name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=None):
+    return REGISTRY.register(
+        Histogram(REGISTRY, name, documentation, labelnames, buckets)
+    )
+
+
+@receiver(setting_changed)
+def reset_registry(setting, **kwargs):
+    if setting == "METRICS_DIR":
+        REGISTRY.reset()
+
+
+requests_total = counter(
+    "userhub_requests_total",
+    "HTTP requests by URL name, method and status code.",
+    ["view", "method", "status"],
+)
+request_seconds = histogram(
+    "userhub_request_duration_seconds", "Time to handle a request.", ["view"]
+)
+request_db_seconds = histogram(
+    "userhub_request_db_seconds", "Time spent in SQL queries per request.", ["view"]
+)
+db_connections = counter(
+    "userhub_db_connections_opened_total", "New database connections.", ["alias"]
+)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    db_connections.inc(alias=connection.alias)
+
+
+class QueryTimer:
+    """
+    Adds up the time a request spends in SQL queries.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+
+
+_query_timer = ContextVar("metrics_query_timer", default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install_query_wrapper(time_query)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        token = _query_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        token = _query_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def record(self, request, response, elapsed, timer):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        requests_total.inc(
+            view=view, method=request.method, status=response.status_code
+        )
+        request_seconds.observe(elapsed, view=view)
+        request_db_seconds.observe(timer.seconds, view=view)
+
+
+FORWARDING_HEADERS = ("HTTP_X_FORWARDED_FOR", "HTTP_X_REAL_IP", "HTTP_FORWARDED")
+
+
+def metrics_view(request):
+    """
+    Serves all metrics to the addresses in METRICS_ALLOWED_IPS and, when
+    METRICS_TOKEN is set, only with ``Authorization: Bearer <token>``.
+
+    Without a token, requests that came through a proxy are refused: a proxy
+    on the same host makes every client look local.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404()
+    allowed_ips = settings.METRICS_ALLOWED_IPS
+    if allowed_ips and request.META.get("REMOTE_ADDR") not in allowed_ips:
+        raise Http404()
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(
+            token.encode(), settings.METRICS_TOKEN.encode()
+        ):
+            raise Http404()
+    elif not allowed_ips or any(
+        header in request.META for header in FORWARDING_HEADERS
+    ):
+        raise Http404()
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
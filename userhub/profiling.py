@@ -0,0 +1,230 @@
+"""
+Opt-in per-request profiling, enabled with REQUEST_PROFILING.
+
+``RequestProfilingMiddleware`` counts and times the SQL run while handling
+a request, along with the view, the response rendering and any sections
+marked with ``timed()``, and reports them in a Server-Timing header::
+
+    Server-Timing: db;dur=4.21;desc="6 queries", serialize;dur=1.03,
+        view;dur=7.90, render;dur=0.32, total;dur=8.75
+
+Sections overlap: queries run while serializing count towards both "db"
+and "serialize". Requests slower than REQUEST_PROFILING_SLOW_MS are logged
+to the "userhub.profiling" logger as one JSON object, sampled at
+REQUEST_PROFILING_SAMPLE_RATE, together with the statements that ran more
+than once, which is how N+1 query patterns show up.
+"""
+
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Number of repeated statements included in the slow-request log.
+REPEATED_STATEMENTS = 5
+
+_profile = ContextVar("request_profile", default=None)
+
+# Installed on every database connection, see install_query_wrapper().
+_query_wrappers = []
+
+
+def install_query_wrapper(wrapper):
+    """
+    Installs ``wrapper`` as an execute_wrapper of every database connection:
+    those of the current thread now, and any connection opened later.
+
+    Connections belong to a thread, and under ASGI a request's queries run
+    in a different thread from its middleware, so wrappers stay installed
+    and find the current request through a ContextVar instead. They must
+    do nothing when no request is being measured.
+    """
+    if wrapper not in _query_wrappers:
+        _query_wrappers.append(wrapper)
+    for alias in connections:
+        add_query_wrappers(connections[alias])
+
+
+@receiver(connection_created)
+def add_query_wrappers(connection, **kwargs):
+    for wrapper in _query_wrappers:
+        if wrapper not in connection.execute_wrappers:
+            # Outermost, and out of the way of execute_wrapper() blocks,
+            # which pop the last wrapper when they exit.
+            connection.execute_wrappers.insert(0, wrapper)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        # sql -> [executions, seconds]
+        self.statements = defaultdict(lambda: [0, 0.0])
+        self.sections = defaultdict(float)
+        self.active = set()
+        self.view_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            statement = self.statements[sql]
+            statement[0] += 1
+            statement[1] += elapsed
+
+    def end_view(self):
+        if self.view_started is not None:
+            self.sections["view"] = time.perf_counter() - self.view_started
+            self.view_started = None
+
+    def repeated_statements(self, limit=REPEATED_STATEMENTS):
+        repeated = sorted(
+            (
+                (count, seconds, sql)
+                for sql, (count, seconds) in self.statements.items()
+                if count > 1
+            ),
+            reverse=True,
+        )
+        return [
+            {"sql": sql, "count": count, "ms": round(seconds * 1000, 2)}
+            for count, seconds, sql in repeated[:limit]
+        ]
+
+    def server_timing(self, total):
+        metrics = [f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"']
+        metrics += [
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in self.sections.items()
+        ]
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(metrics)
+
+
+@contextmanager
+def timed(name):
+    """
+    Adds the time spent in the block to the current request's ``name``
+    section. Does nothing when profiling is off; nested blocks of the same
+    name are only counted once. Also works as a decorator.
+    """
+    profile = _profile.get()
+    if profile is None or name in profile.active:
+        yield
+        return
+    profile.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections[name] += time.perf_counter() - started
+        profile.active.discard(name)
+
+
+def profile_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install_query_wrapper(profile_query)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.REQUEST_PROFILING:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.finish(request, response, profile, started)
+
+    async def __acall__(self, request):
+        if not settings.REQUEST_PROFILING:
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.finish(request, response, profile, started)
+
+    def finish(self, request, response, profile, started):
+        # Responses without a render step (files, redirects).
+        profile.end_view()
+        total = time.perf_counter() - started
+        response["Server-Timing"] = profile.server_timing(total)
+        if total * 1000 >= settings.REQUEST_PROFILING_SLOW_MS:
+            self.log_slow_request(request, response, profile, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _profile.get()
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Called between the view returning and the response being rendered.
+        profile = _profile.get()
+        if profile is not None:
+            profile.end_view()
+            started = time.perf_counter()
+
+            def rendered(response):
+                profile.sections["render"] += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def log_slow_request(self, request, response, profile, total):
+        if random.random() >= settings.REQUEST_PROFILING_SAMPLE_RATE:
+            return
+        user = getattr(request, "user", None)
+        record = {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "user_id": user.pk if user is not None and user.is_authenticated else None,
+            "total_ms": round(total * 1000, 2),
+            "db_ms": round(profile.db_time * 1000, 2),
+            "queries": profile.queries,
+            **{
+                f"{name}_ms": round(seconds * 1000, 2)
+                for name, seconds in profile.sections.items()
+            },
+            "repeated_sql": profile.repeated_statements(),
+        }
+        logger.warning("Slow request %s", json.dumps(record))
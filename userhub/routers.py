@@ -0,0 +1,205 @@
+"""
+Read/write splitting across the primary database and read replicas.
+
+``ReplicaRoutingMiddleware`` decides per request where reads go: GET, HEAD
+and OPTIONS requests read from a replica in DATABASE_READ_REPLICAS, unless
+the client wrote something in the last REPLICA_STICKY_SECONDS, in which case
+it keeps reading from the primary until the replicas have caught up. Writes,
+and any reads outside a request (jobs, management commands), always use the
+primary. ``use_primary()`` forces primary reads for a block of code.
+
+An authenticated user's writes are remembered in REPLICA_STICKY_CACHE, which
+must be shared by the workers (see userhub.caches), so API clients without a
+cookie jar read their own writes too. Every client's writes are also
+remembered in a signed cookie, which covers anonymous requests.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .caches import get_shared_cache
+
+PRIMARY = "default"
+STICKY_KEY = "db:sticky:{}"
+STICKY_COOKIE = "db_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# True while reads may be served by a replica.
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def use_primary():
+    """
+    Sends the reads in the block to the primary.
+    """
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_READ_REPLICAS
+        if replicas and _replica_reads.get():
+            return random.choice(replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {PRIMARY, *settings.DATABASE_READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, see the sync_replica command.
+        if db in settings.DATABASE_READ_REPLICAS:
+            return False
+        return None
+
+
+def request_user_id(request):
+    """
+    Returns the user id in the request's access token, without touching the
+    database, or None.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        # Rejected by the view itself.
+        return None
+    return token.get(api_settings.USER_ID_CLAIM)
+
+
+def get_sticky_cache():
+    """
+    Returns REPLICA_STICKY_CACHE, raising ImproperlyConfigured unless it is
+    shared by the workers: a write must stick on whichever worker serves the
+    user's next read.
+    """
+    cache = get_shared_cache(settings.REPLICA_STICKY_CACHE)
+    if cache is None:
+        raise ImproperlyConfigured(
+            "DATABASE_READ_REPLICAS requires REPLICA_STICKY_CACHE to name a "
+            f"cache shared by all workers, not {settings.REPLICA_STICKY_CACHE!r}; "
+            "see SHARED_CACHE_BACKEND."
+        )
+    return cache
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        if settings.DATABASE_READ_REPLICAS:
+            # Fail at startup rather than on the first request.
+            get_sticky_cache()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.DATABASE_READ_REPLICAS:
+            return self.get_response(request)
+
+        cache, user_id = self.sticky_cache(request)
+        if request.method in SAFE_METHODS:
+            sticky = self.has_sticky_cookie(request) or (
+                cache is not None and cache.get(STICKY_KEY.format(user_id)) is not None
+            )
+        else:
+            sticky = True
+
+        token = _replica_reads.set(not sticky)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            self.set_sticky_cookie(response)
+            if cache is not None:
+                cache.set(
+                    STICKY_KEY.format(user_id), 1, settings.REPLICA_STICKY_SECONDS
+                )
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_READ_REPLICAS:
+            return await self.get_response(request)
+
+        cache, user_id = self.sticky_cache(request)
+        if request.method in SAFE_METHODS:
+            sticky = self.has_sticky_cookie(request) or (
+                cache is not None
+                and await cache.aget(STICKY_KEY.format(user_id)) is not None
+            )
+        else:
+            sticky = True
+
+        token = _replica_reads.set(not sticky)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            self.set_sticky_cookie(response)
+            if cache is not None:
+                await cache.aset(
+                    STICKY_KEY.format(user_id), 1, settings.REPLICA_STICKY_SECONDS
+                )
+        return response
+
+    def sticky_cache(self, request):
+        """
+        Returns REPLICA_STICKY_CACHE and the request's user id, or (None,
+        None) for anonymous requests, whose writes only stick by cookie.
+        """
+        user_id = request_user_id(request)
+        if user_id is None:
+            return None, None
+        return get_sticky_cache(), user_id
+
+    def has_sticky_cookie(self, request):
+        # Signed, so that clients cannot keep themselves on the primary.
+        value = request.get_signed_cookie(
+            STICKY_COOKIE,
+            default=None,
+            salt=STICKY_COOKIE,
+            max_age=settings.REPLICA_STICKY_SECONDS,
+        )
+        return value is not None
+
+    def set_sticky_cookie(self, response):
+        response.set_signed_cookie(
+            STICKY_COOKIE,
+            "1",
+            salt=STICKY_COOKIE,
+            max_age=settings.REPLICA_STICKY_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
@@ -56,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "userhub.metrics.MetricsMiddleware",
+    "userhub.profiling.RequestProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -64,6 +66,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "userhub.routers.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "userhub.urls"
@@ -97,6 +100,99 @@ DATABASES = {
     }
 }
 
+# DATABASE_PROFILE=production tunes SQLite for concurrent use: WAL lets reads
+# proceed during a write, synchronous=NORMAL is durable under WAL except
+# for the last commits on power loss, writers wait up to the timeout for the
+# lock instead of failing with "database is locked", and connections are
+# kept open between requests.
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "development")
+SQLITE_PRODUCTION_OPTIONS = {
+    "timeout": 20,  # busy timeout, in seconds
+    "pragmas": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # in KiB when negative
+        "temp_store": "MEMORY",
+    },
+}
+
+if DATABASE_PROFILE == "production":
+    DATABASES["default"].update(
+        {
+            "ENGINE": "userhub.sqlite3",
+            "CONN_MAX_AGE": int(os.getenv("CONN_MAX_AGE", "600")),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": SQLITE_PRODUCTION_OPTIONS,
+        }
+    )
+
+
+# Read replicas: a comma-separated list of SQLite files kept in sync with the
+# primary by `manage.py sync_replica`. Safe requests read from them, except
+# for REPLICA_STICKY_SECONDS after the same client wrote something. Keep that
+# window longer than the replica lag (the sync interval): reads after it may
+# also be written to the response cache.
+DATABASE_READ_REPLICAS = []
+for number, path in enumerate(
+    filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), start=1
+):
+    alias = f"replica{number}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "NAME": path.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_READ_REPLICAS.append(alias)
+
+# Task shards: a comma-separated list of SQLite files that, with "default" as
+# shard 0, hold the tasks of users hashed to them (see tasks.sharding). Run
+# `manage.py migrate --database tasks_shardN` for each, and
+# `manage.py rebalance_task_shards` after changing the list.
+TASK_SHARDS = ["default"]
+for number, path in enumerate(
+    filter(None, os.getenv("TASK_SHARD_DATABASES", "").split(",")), start=1
+):
+    alias = f"tasks_shard{number}"
+    DATABASES[alias] = {**DATABASES["default"], "NAME": path.strip()}
+    TASK_SHARDS.append(alias)
+
+DATABASE_ROUTERS = ["tasks.sharding.TaskShardRouter", "userhub.routers.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+# Writes stick per user in this cache, which must be shared by all workers
+# (see SHARED_CACHE_BACKEND below), and per client in a signed cookie.
+REPLICA_STICKY_CACHE = os.getenv("REPLICA_STICKY_CACHE", "shared")
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Use a shared backend (e.g. Redis/Memcached) when running several workers,
+# so that invalidations reach every process.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "tasks": {
+        "BACKEND": os.getenv(
+            "TASK_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("TASK_CACHE_LOCATION", "tasks"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("TASK_CACHE_MAX_ENTRIES", "10000"))},
+    },
+}
+# A cache shared by all workers (e.g. Redis), for state every process must
+# see; read replicas require it, and cached authentication uses it.
+if os.getenv("SHARED_CACHE_BACKEND"):
+    CACHES["shared"] = {
+        "BACKEND": os.getenv("SHARED_CACHE_BACKEND"),
+        "LOCATION": os.getenv("SHARED_CACHE_LOCATION", ""),
+    }
+
+# Per-user versioned cache for task list/detail responses (tasks.cache)
+TASK_CACHE_ALIAS = "tasks"
+TASK_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -117,6 +213,14 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+AUTHENTICATION_BACKENDS = [
+    # Email/password login for the API
+    "accounts.backends.EmailBackend",
+    # Username/password login for the admin site
+    "django.contrib.auth.backends.ModelBackend",
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -143,14 +247,25 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Hash uploads while they stream in, for content-addressed attachments
+FILE_UPLOAD_HANDLERS = [
+    "tasks.uploadhandlers.HashingMemoryFileUploadHandler",
+    "tasks.uploadhandlers.HashingTemporaryFileUploadHandler",
+]
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # Same output as DRF's JSONRenderer; uses orjson when it is installed.
+    "DEFAULT_RENDERER_CLASSES": [
+        "userhub.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
     "DEFAULT_FILTER_BACKENDS": [
@@ -164,9 +279,106 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "ROTATE_REFRESH_TOKENS": True,
-    "BLACKLIST_AFTER_ROTATION": True,
+    # Rotated and logged-out refresh tokens are revoked in
+    # TOKEN_REVOCATION_STORE rather than the token_blacklist tables.
+    "BLACKLIST_AFTER_ROTATION": False,
+    "TOKEN_REFRESH_SERIALIZER": "accounts.serializers.RevocableTokenRefreshSerializer",
 }
 
+# Where revoked refresh token ids are kept until the tokens expire: a table
+# (the default), a cache that never evicts (TOKEN_REVOCATION_CACHE, e.g.
+# Redis with maxmemory-policy noeviction), or process memory for a single
+# process.
+TOKEN_REVOCATION_STORE = os.getenv(
+    "TOKEN_REVOCATION_STORE", "accounts.revocation.DatabaseRevocationStore"
+)
+TOKEN_REVOCATION_CACHE = os.getenv("TOKEN_REVOCATION_CACHE", "default")
+
+# Users resolved by CachedJWTAuthentication are kept in-process for up to
+# AUTH_USER_CACHE_TTL seconds. Invalidation goes through AUTH_USER_CACHE_ALIAS,
+# which must be shared by the workers (see SHARED_CACHE_BACKEND); otherwise
+# users are loaded from the database on every request.
+AUTH_USER_CACHE_ALIAS = os.getenv("AUTH_USER_CACHE_ALIAS", "shared")
+AUTH_USER_CACHE_MAX_ENTRIES = 10000
+AUTH_USER_CACHE_TTL = 300
+
+# Serve login, registration and password reset from async views that hash
+# passwords on a process pool. Enabled by default under userhub.asgi.
+ASYNC_AUTH_VIEWS = os.getenv("ASYNC_AUTH_VIEWS", "False") == "True"
+# Worker processes for password hashing; 0 hashes in threads instead.
+PASSWORD_HASHING_POOL_SIZE = int(
+    os.getenv("PASSWORD_HASHING_POOL_SIZE", str(os.cpu_count() or 1))
+)
+# Hashing calls allowed in flight before requests are answered with 503.
+PASSWORD_HASHING_MAX_PENDING = int(
+    os.getenv("PASSWORD_HASHING_MAX_PENDING", str(4 * PASSWORD_HASHING_POOL_SIZE or 16))
+)
+
+# Resumable chunked attachment uploads (/api/tasks/uploads/)
+ATTACHMENT_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, "upload_chunks")
+ATTACHMENT_UPLOAD_MAX_SIZE = 1024 * 1024 * 1024  # 1 GiB
+# Uploads a user may have in progress at once.
+ATTACHMENT_UPLOAD_MAX_OPEN = int(os.getenv("ATTACHMENT_UPLOAD_MAX_OPEN", "10"))
+# Uploads without a chunk for this many seconds expire; run the
+# cleanup_uploads command periodically to delete them and their part files.
+ATTACHMENT_UPLOAD_MAX_AGE = int(os.getenv("ATTACHMENT_UPLOAD_MAX_AGE", str(24 * 3600)))
+
+# Attachment blobs saved or reused more recently than this are not deleted
+# with their last task, in case a task being saved uses them; the
+# dedupe_attachments command collects them later.
+ATTACHMENT_BLOB_MIN_AGE = 600
+
+# Attachment downloads (/api/tasks/<id>/download/). Set to "x-sendfile"
+# (Apache/lighttpd) or "x-accel-redirect" (nginx) to let the front proxy send
+# the file. For nginx, map the prefix below to MEDIA_ROOT in an internal location.
+ATTACHMENT_SENDFILE_BACKEND = os.getenv("ATTACHMENT_SENDFILE_BACKEND", "")
+ATTACHMENT_ACCEL_REDIRECT_PREFIX = os.getenv(
+    "ATTACHMENT_ACCEL_REDIRECT_PREFIX", "/protected-media/"
+)
+
+# Longest side, in pixels, of image attachment thumbnails (tasks.thumbnails)
+TASK_THUMBNAIL_SIZE = int(os.getenv("TASK_THUMBNAIL_SIZE", "256"))
+
+# Encode task lists from values() rows instead of TaskSerializer (tasks.encoders)
+TASK_LIST_FAST_PATH = os.getenv("TASK_LIST_FAST_PATH", "True") == "True"
+
+# Background jobs (delete_all and other long-running task operations)
+TASK_JOBS_WORKERS = int(os.getenv("TASK_JOBS_WORKERS", "2"))
+# Run jobs inline instead of on the worker pool (useful for tests).
+TASK_JOBS_ALWAYS_EAGER = os.getenv("TASK_JOBS_ALWAYS_EAGER", "False") == "True"
+# Unfinished jobs without progress for this long are given up as stale: their
+# worker died (jobs run in-process), so delete_all starts a new job instead.
+TASK_JOB_STALE_SECONDS = 600
+TASK_DELETE_CHUNK_SIZE = 500
+# Rows fetched per database round trip by /api/tasks/export/.
+TASK_EXPORT_CHUNK_SIZE = 2000
+# Rows validated and inserted per transaction by task imports (tasks.importer),
+# and the number of row errors an import reports at most.
+TASK_IMPORT_BATCH_SIZE = 1000
+TASK_IMPORT_MAX_ERRORS = 1000
+# Seconds to pause between delete chunks so waiting writers get the lock.
+TASK_DELETE_CHUNK_PAUSE = 0.01
+
+# Per-request SQL and timing breakdown in a Server-Timing header (userhub.profiling)
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "False") == "True"
+# Requests slower than this are logged, with their repeated SQL statements.
+REQUEST_PROFILING_SLOW_MS = int(os.getenv("REQUEST_PROFILING_SLOW_MS", "500"))
+# Fraction of slow requests that are logged.
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv("REQUEST_PROFILING_SAMPLE_RATE", "1.0"))
+
+# Prometheus metrics (userhub.metrics), served at /metrics/ to METRICS_ALLOWED_IPS.
+# Set METRICS_TOKEN whenever /metrics/ is reachable through a proxy; scrapers
+# then send it as "Authorization: Bearer <token>", and METRICS_ALLOWED_IPS may
+# be empty to allow any address.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False") == "True"
+METRICS_ALLOWED_IPS = [
+    ip for ip in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip
+]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Directory shared by the worker processes of a multi-process server; empty it
+# when the server starts. Without it, every process only reports its own values.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+
 # CORS Configuration
 # Set to False and rely on the whitelist below for better security.
 CORS_ALLOW_ALL_ORIGINS = False
@@ -0,0 +1,24 @@
+"""
+SQLite backend that applies PRAGMAs to every new connection.
+
+Django 4.2's sqlite3 backend passes OPTIONS straight to ``sqlite3.connect()``
+and has no init hook, so this backend takes a ``pragmas`` mapping out of
+OPTIONS and runs ``PRAGMA name = value`` for each entry on connect::
+
+    "OPTIONS": {"timeout": 20, "pragmas": {"journal_mode": "WAL"}}
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop("pragmas", {})
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
@@ -0,0 +1,286 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tasks.models import Task
+
+from . import metrics
+from .profiling import RequestProfilingMiddleware
+from .routers import STICKY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, use_primary
+
+SHARED_TEST_CACHES = {
+    **settings.CACHES,
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(tempfile.gettempdir(), "userhub-tests-shared"),
+    },
+}
+
+
+@override_settings(
+    CACHES=SHARED_TEST_CACHES,
+    DATABASE_READ_REPLICAS=["replica1"],
+    REPLICA_STICKY_CACHE="shared",
+    REPLICA_STICKY_SECONDS=5,
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        caches["shared"].clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        token = AccessToken.for_user(User(pk=7, username="reader"))
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+    def route(self, method, cookies=None, **extra):
+        """
+        Returns the alias a read inside the request goes to, and the response.
+        """
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Task))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)("/api/tasks/", **extra)
+        request.COOKIES.update(cookies or {})
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen[0], response
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.router.db_for_read(Task), "default")
+        self.assertEqual(self.route("get", **self.auth)[0], "replica1")
+        self.assertEqual(self.router.db_for_write(Task), "default")
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        self.assertEqual(self.route("post", **self.auth)[0], "default")
+        # Per user, for API clients that do not keep cookies.
+        self.assertEqual(self.route("get", **self.auth)[0], "default")
+        self.assertEqual(self.route("get")[0], "replica1")
+
+    def test_anonymous_writes_stick_by_signed_cookie(self):
+        _, response = self.route("post")
+        cookies = {STICKY_COOKIE: response.cookies[STICKY_COOKIE].value}
+        self.assertEqual(self.route("get", cookies)[0], "default")
+        self.assertEqual(self.route("get")[0], "replica1")
+
+        forged = {STICKY_COOKIE: "9999999999"}
+        self.assertEqual(self.route("get", forged)[0], "replica1")
+        with mock.patch("django.core.signing.time.time", return_value=2e9):
+            # Expired.
+            self.assertEqual(self.route("get", cookies)[0], "replica1")
+
+    def test_replicas_require_a_shared_cache(self):
+        for alias in ("default", "missing"):
+            with self.subTest(alias=alias), self.settings(REPLICA_STICKY_CACHE=alias):
+                with self.assertRaises(ImproperlyConfigured):
+                    ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+    def test_async_requests(self):
+        seen = []
+
+        async def view(request):
+            seen.append(self.router.db_for_read(Task))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(self.factory.post("/api/tasks/"))
+        request = self.factory.get("/api/tasks/")
+        async_to_sync(middleware)(request)
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        async_to_sync(middleware)(request)
+        self.assertEqual(seen, ["default", "replica1", "default"])
+
+    @override_settings(DEBUG=True)
+    def test_middleware_is_not_adapted_under_asgi(self):
+        # Django logs every adaptation when DEBUG is on.
+        with self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+    def test_use_primary(self):
+        seen = []
+
+        def view(request):
+            with use_primary():
+                seen.append(self.router.db_for_read(Task))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(self.factory.get("/api/tasks/"))
+        self.assertEqual(seen, ["default"])
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def test_production_options_apply_pragmas(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        handler = ConnectionHandler(
+            {
+                "default": {
+                    "ENGINE": "userhub.sqlite3",
+                    "NAME": os.path.join(directory.name, "db.sqlite3"),
+                    "OPTIONS": settings.SQLITE_PRODUCTION_OPTIONS,
+                }
+            }
+        )
+        self.addCleanup(handler.close_all)
+
+        pragmas = {}
+        with handler["default"].cursor() as cursor:
+            for name in (
+                "journal_mode",
+                "synchronous",
+                "busy_timeout",
+                "cache_size",
+                "temp_store",
+            ):
+                pragmas[name] = cursor.execute(f"PRAGMA {name}").fetchone()[0]
+        self.assertEqual(
+            pragmas,
+            {
+                "journal_mode": "wal",
+                "synchronous": 1,  # NORMAL
+                "busy_timeout": 20000,
+                "cache_size": -64 * 1024,
+                "temp_store": 2,  # MEMORY
+            },
+        )
+
+
+@override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_SLOW_MS=60000)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        caches[settings.TASK_CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="profiled", password="pass")
+        self.client.force_authenticate(user=self.user)
+        Task.objects.create(user=self.user, title="Profiled")
+
+    def test_server_timing_header(self):
+        response = self.client.get("/api/tasks/")
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries"')
+        for metric in ("serialize", "view", "render", "total"):
+            self.assertIn(f"{metric};dur=", timing)
+
+        with override_settings(REQUEST_PROFILING=False):
+            response = self.client.get("/api/tasks/")
+        self.assertNotIn("Server-Timing", response)
+
+    def test_async_requests(self):
+        async def view(request):
+            # Queries run in another thread, on that thread's connection.
+            await sync_to_async(Task.objects.filter(title="Profiled").exists)()
+            return HttpResponse()
+
+        middleware = RequestProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get("/"))
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+
+    @override_settings(REQUEST_PROFILING_SLOW_MS=0)
+    def test_slow_requests_log_repeated_queries(self):
+        def view(request):
+            for _ in range(3):
+                Task.objects.filter(title="Profiled").exists()
+            return HttpResponse()
+
+        request = RequestFactory().get("/api/tasks/?page=2")
+        with self.assertLogs("userhub.profiling", "WARNING") as logs:
+            RequestProfilingMiddleware(view)(request)
+        record = json.loads(logs.records[0].args[0])
+        self.assertEqual(record["path"], "/api/tasks/?page=2")
+        self.assertEqual(record["queries"], 3)
+        self.assertEqual(record["repeated_sql"][0]["count"], 3)
+        self.assertIn('"title" =', record["repeated_sql"][0]["sql"])
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTests(TestCase):
+    def test_request_metrics_endpoint(self):
+        client = APIClient()
+        user = User.objects.create_user(username="measured", password="pass")
+        client.force_authenticate(user=user)
+        client.get("/api/tasks/")
+
+        response = self.client.get("/metrics/")
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertRegex(
+            body,
+            r'userhub_requests_total\{view="task-list",method="GET",status="200"\} '
+            r"[1-9]",
+        )
+        self.assertIn(
+            'userhub_request_duration_seconds_bucket{view="task-list",le="+Inf"}', body
+        )
+        self.assertIn("# TYPE userhub_request_db_seconds histogram", body)
+
+        response = self.client.get("/metrics/", REMOTE_ADDR="10.0.0.8")
+        self.assertEqual(response.status_code, 404)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get("/metrics/").status_code, 404)
+
+    def test_endpoint_behind_a_proxy_requires_a_token(self):
+        # A proxy on the same host: every request comes from localhost.
+        response = self.client.get("/metrics/", HTTP_X_FORWARDED_FOR="203.0.113.9")
+        self.assertEqual(response.status_code, 404)
+        with override_settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get("/metrics/").status_code, 404)
+
+        with override_settings(METRICS_TOKEN="s3cret", METRICS_ALLOWED_IPS=[]):
+            for authorization in ("", "Bearer wrong", "Basic s3cret"):
+                response = self.client.get(
+                    "/metrics/",
+                    HTTP_AUTHORIZATION=authorization,
+                    HTTP_X_FORWARDED_FOR="203.0.113.9",
+                )
+                self.assertEqual(response.status_code, 404)
+            response = self.client.get(
+                "/metrics/",
+                HTTP_AUTHORIZATION="Bearer s3cret",
+                HTTP_X_FORWARDED_FOR="203.0.113.9",
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_values_are_summed_across_processes(self):
+        registry = metrics.Registry()
+        logins = registry.register(
+            metrics.Counter(registry, "logins_total", "Logins.", ["result"])
+        )
+        pending = registry.register(metrics.Gauge(registry, "pending", "Pending."))
+        latency = registry.register(
+            metrics.Histogram(registry, "latency", "Latency.", buckets=[0.1, 1])
+        )
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            self.settings(METRICS_DIR=directory),
+        ):
+            logins.inc(result="ok")
+            pending.set(2)
+            latency.observe(0.05)
+            latency.observe(0.5)
+            # Values left behind by a worker process that has exited.
+            dead = metrics.MmapValues(os.path.join(directory, "metrics-999999.db"))
+            dead.add(logins.key("", {"result": "ok"}), 4)
+            dead.set(pending.key("", {}), 5)
+
+            body = registry.render()
+        self.assertIn('logins_total{result="ok"} 5.0', body)
+        self.assertIn("pending 2.0", body)
+        self.assertIn('latency_bucket{le="0.1"} 1.0', body)
+        self.assertIn('latency_bucket{le="1.0"} 2.0', body)
+        self.assertIn('latency_bucket{le="+Inf"} 2.0', body)
+        self.assertIn("latency_count 2.0", body)
@@ -6,6 +6,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from .metrics import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="UserHub API",
@@ -30,6 +32,7 @@ urlpatterns = [
         name="schema-swagger-ui",
     ),
     path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
+    path("metrics/", metrics_view, name="metrics"),
     # Frontend route - This must be the last URL pattern to catch the root
     path("", include("frontend.urls", namespace="frontend")),
 ]